@@ -1,12 +1,27 @@
 # app.py — Planner de Treinos (GitHub CSV: treinos + exercicios + log)
 import streamlit as st
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from PIL import Image, ImageSequence
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import base64
+import bisect
+import hashlib
 import json
 import requests
 import io
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
 import time
+import unicodedata
 
 st.set_page_config(page_title="Planner de Treinos", layout="wide")
 
@@ -30,6 +45,8 @@ def today_pt() -> str:
 
 
 def goto(screen: str):
+    # saiu da tela: grava já o que o autolog tiver pendente
+    _autolog_queue().request_flush()
     st.session_state.screen = screen
     st.rerun()
 
@@ -61,14 +78,20 @@ def init_state():
         st.session_state.ex_action = None
     if "ex_edit_name" not in st.session_state:
         st.session_state.ex_edit_name = ""
-
-    # ✅ REFRESH: versões para "quebrar" cache quando salvar no GitHub
-    if "v_treinos" not in st.session_state:
-        st.session_state.v_treinos = 0
-    if "v_exercicios" not in st.session_state:
-        st.session_state.v_exercicios = 0
-    if "v_log" not in st.session_state:
-        st.session_state.v_log = 0
+    # biblioteca paginada
+    if "ex_page" not in st.session_state:
+        st.session_state.ex_page = 0
+    if "ex_page_size" not in st.session_state:
+        st.session_state.ex_page_size = EX_PAGE_SIZES[0]
+    if "ex_query" not in st.session_state:
+        st.session_state.ex_query = ("", "")
+
+    # ✅ REFRESH: versões globais (sha) que esta sessão já renderizou — ver data_version()
+    if "seen_versions" not in st.session_state:
+        st.session_state.seen_versions = {}
+    if "seen_notice" not in st.session_state:
+        # avisos de rollback anteriores a esta sessão não são mostrados
+        st.session_state.seen_notice = max((n for n, _ in _table_writer().notices), default=0)
 
 
 def _now_utc_z():
@@ -88,6 +111,16 @@ def _gh():
     )
 
 
+# releitura é um GET condicional (ETag): com dado igual custa um 304, então o TTL pode ser curto
+CACHE_TTL_SECONDS = 15
+
+
+def _gh_repo_url(owner: str, repo: str) -> str:
+    # github.api_url em st.secrets permite apontar para GitHub Enterprise ou um servidor local de testes
+    base = str(st.secrets.get("github", {}).get("api_url", "") or "https://api.github.com").rstrip("/")
+    return f"{base}/repos/{owner}/{repo}"
+
+
 def _gh_headers(token: str):
     h = {
         "Accept": "application/vnd.github+json",
@@ -98,43 +131,380 @@ def _gh_headers(token: str):
     return h
 
 
-def gh_read_file(path: str) -> tuple[str, str]:
-    """Retorna (texto, sha). Se não existir, ('','')."""
-    token, owner, repo, branch = _gh()
-    url = f"https://api.github.com/repos/{owner}/{repo}/contents/{path}?ref={branch}"
-    r = requests.get(url, headers=_gh_headers(token), timeout=20)
+GH_RETRIES = 4
+GH_MAX_WAIT_SECONDS = 30.0
+
+
+@st.cache_resource
+def _http() -> requests.Session:
+    """Sessão HTTP compartilhada (keep-alive): evita um handshake TCP+TLS por chamada."""
+    s = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+
+class _GhMetrics:
+    """
+    'METHOD /rota' -> {calls, retries, errors, total_ms, last_ms}, compartilhado entre
+    sessões. Atualizado pelas threads de autolog/gravação/prefetch/mídia: tudo sob lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes: dict[str, dict] = {}
+
+    def record(self, key: str, ms: float | None = None, retry: bool = False, error: bool = False):
+        with self.lock:
+            m = self.routes.setdefault(key, {"calls": 0, "retries": 0, "errors": 0, "total_ms": 0.0, "last_ms": 0.0})
+            if ms is not None:
+                m["calls"] += 1
+                m["total_ms"] += ms
+                m["last_ms"] = ms
+            m["retries"] += int(retry)
+            m["errors"] += int(error)
+
+    def table(self) -> pd.DataFrame:
+        """Uma linha por rota, mais lenta (média) primeiro."""
+        with self.lock:
+            rows = [{"rota": k, **v} for k, v in self.routes.items()]
+        df = pd.DataFrame(rows, columns=["rota", "calls", "retries", "errors", "total_ms", "last_ms"])
+        df["avg_ms"] = (df["total_ms"] / df["calls"].where(df["calls"] > 0)).round(1)
+        df["last_ms"] = df["last_ms"].round(1)
+        return df.drop(columns="total_ms").sort_values("avg_ms", ascending=False, ignore_index=True)
+
+
+@st.cache_resource
+def _gh_metrics() -> _GhMetrics:
+    return _GhMetrics()
+
+
+def _gh_retry_wait(r, attempt: int) -> float:
+    """Segundos até a próxima tentativa, ou -1 se a resposta não deve ser repetida."""
+    rate_limited = r.status_code == 429 or (
+        r.status_code == 403 and (r.headers.get("Retry-After") or r.headers.get("X-RateLimit-Remaining") == "0")
+    )
+    if not rate_limited and r.status_code < 500:
+        return -1
+    if r.headers.get("Retry-After"):
+        try:
+            return float(r.headers["Retry-After"])
+        except ValueError:
+            pass
+    if r.headers.get("X-RateLimit-Remaining") == "0" and r.headers.get("X-RateLimit-Reset"):
+        try:
+            return max(0.0, float(r.headers["X-RateLimit-Reset"]) - time.time())
+        except ValueError:
+            pass
+    return 0.5 * (2 ** attempt)
+
+
+def _gh_request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Toda chamada à API passa por aqui: sessão com pool, backoff exponencial em
+    5xx/429/rate limit secundário (respeitando Retry-After / X-RateLimit-Reset) e
+    métricas de latência. Espera maior que GH_MAX_WAIT_SECONDS não é feita: a
+    resposta volta para quem chamou.
+    """
+    kwargs.setdefault("timeout", 20)
+    route = re.sub(r"^https?://[^/]+", "", url.split("?")[0])
+    route = re.sub(r"/[0-9a-f]{40}(?=/|$)", "/{sha}", route)  # blobs/commits: uma rota, não uma por sha
+    key = f"{method} {route}"
+    metrics = _gh_metrics()
+
+    for attempt in range(GH_RETRIES):
+        t0 = time.perf_counter()
+        try:
+            r = _http().request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == GH_RETRIES - 1:
+                metrics.record(key, error=True)
+                raise
+            wait = 0.5 * (2 ** attempt)
+        else:
+            wait = _gh_retry_wait(r, attempt) if attempt < GH_RETRIES - 1 else -1
+            if wait > GH_MAX_WAIT_SECONDS:
+                wait = -1
+        finally:
+            metrics.record(key, ms=(time.perf_counter() - t0) * 1000.0)
+
+        if wait < 0:
+            if r.status_code >= 400 and r.status_code != 404:
+                metrics.record(key, error=True)
+            return r
+        metrics.record(key, retry=True)
+        time.sleep(wait)
+
+
+@st.cache_resource
+def _sha_cache() -> dict:
+    """
+    path -> blob sha conhecido (compartilhado entre sessões).
+    Atualizado em toda leitura e em todo PUT bem-sucedido, para o PUT não precisar de um GET antes.
+    """
+    return {}
+
+
+@st.cache_resource
+def _etag_cache() -> dict:
+    """url -> (etag, json) da última resposta 200 (compartilhado entre sessões)."""
+    return {}
+
+
+def _gh_get_json(url: str, token: str):
+    """
+    GET condicional: manda If-None-Match com o ETag guardado e, no 304, devolve o
+    json da resposta anterior (304 não conta no rate limit). Retorna None se 404.
+    """
+    cache = _etag_cache()
+    cached = cache.get(url)
+    headers = _gh_headers(token)
+    if cached:
+        headers["If-None-Match"] = cached[0]
+    r = _gh_request("GET", url, headers=headers)
+    if r.status_code == 304 and cached:
+        return cached[1]
     if r.status_code == 404:
-        return "", ""
+        cache.pop(url, None)
+        return None
     r.raise_for_status()
     data = r.json()
+    etag = r.headers.get("ETag", "")
+    if etag:
+        cache[url] = (etag, data)
+    return data
+
+
+def _gh_file_meta(path: str):
+    """json da Contents API para o arquivo (None se não existir); atualiza o cache de sha."""
+    token, owner, repo, branch = _gh()
+    url = f"{_gh_repo_url(owner, repo)}/contents/{path}?ref={branch}"
+    data = _gh_get_json(url, token)
+    _sha_cache()[path] = data.get("sha", "") if data else ""
+    return data
+
+
+def _gh_is_large(data: dict) -> bool:
+    # acima de 1 MB a Contents API não manda o conteúdo (content vazio, encoding "none")
+    return data.get("encoding") == "none" or (not data.get("content") and int(data.get("size", 0) or 0) > 0)
+
+
+def _gh_open_raw(path: str):
+    """
+    Baixa o arquivo com o media type raw (até 100 MB), em streaming:
+    retorna um stream de texto para ir direto ao parser.
+    """
+    token, owner, repo, branch = _gh()
+    url = f"{_gh_repo_url(owner, repo)}/contents/{path}?ref={branch}"
+    headers = _gh_headers(token)
+    headers["Accept"] = "application/vnd.github.raw"
+    r = _gh_request("GET", url, headers=headers, stream=True)
+    r.raise_for_status()
+    r.raw.decode_content = True
+    r.raw.auto_close = False  # senão o TextIOWrapper vê o stream "fechado" ao chegar no fim
+    return io.TextIOWrapper(r.raw, encoding="utf-8", errors="replace")
+
+
+def gh_read_file(path: str) -> tuple[str, str]:
+    """Retorna (texto, sha). Se não existir, ('','')."""
+    data = _gh_file_meta(path)
+    if data is None:
+        return "", ""
     sha = data.get("sha", "")
+    if _gh_is_large(data):
+        with _gh_open_raw(path) as f:
+            return f.read(), sha
     content_b64 = data.get("content", "") or ""
     txt = base64.b64decode(content_b64).decode("utf-8", errors="replace") if content_b64 else ""
     return txt, sha
 
 
-def gh_write_file(path: str, txt: str, message: str) -> bool:
+def gh_read_bytes(path: str) -> tuple[bytes, str]:
+    """Como gh_read_file, para arquivos binários: (conteúdo, sha) ou (b'', '')."""
+    data = _gh_file_meta(path)
+    if data is None:
+        return b"", ""
+    if _gh_is_large(data):
+        with _gh_open_raw(path) as f:
+            return f.buffer.read(), data.get("sha", "")
+    return base64.b64decode(data.get("content", "") or ""), data.get("sha", "")
+
+
+def gh_list_dir(path: str) -> list[dict]:
+    """Lista um diretório do repo: [{name, path, sha, size}]. Se não existir, []."""
     token, owner, repo, branch = _gh()
-    if not token:
-        st.error("Configure github.token em st.secrets (Streamlit Cloud → Settings → Secrets).")
-        return False
+    url = f"{_gh_repo_url(owner, repo)}/contents/{path}?ref={branch}"
+    data = _gh_get_json(url, token)
+    if not isinstance(data, list):
+        return []
+    files = [
+        {"name": it.get("name", ""), "path": it.get("path", ""), "sha": it.get("sha", ""), "size": int(it.get("size", 0) or 0)}
+        for it in data
+        if it.get("type") == "file"
+    ]
+    cache = _sha_cache()
+    for f in files:
+        cache[f["path"]] = f["sha"]
+    return files
+
+
+def _gh_known_sha(path: str) -> str:
+    cache = _sha_cache()
+    if path not in cache:
+        _gh_file_meta(path)
+    return cache.get(path, "")
+
+
+GH_CONFLICT = "Conflito"
 
-    api_url = f"https://api.github.com/repos/{owner}/{repo}/contents/{path}"
-    _, sha = gh_read_file(path)
 
+def _is_conflict(err: str) -> bool:
+    return str(err or "").startswith(GH_CONFLICT)
+
+
+def gh_put_file(path: str, txt: str | bytes, message: str, base_sha: str | None = None) -> tuple[bool, str]:
+    """
+    PUT sem UI: retorna (ok, mensagem_de_erro). txt pode ser bytes (arquivo binário).
+    Pode ser chamado fora da thread do Streamlit (ex.: worker do autolog).
+    base_sha: o sha em que o conteúdo novo se baseou. Se o arquivo mudou desde então,
+    não sobrescreve: retorna (False, "Conflito: ...") para quem chamou fazer o merge.
+    Sem base_sha, sobrescreve (relê o sha e tenta de novo uma vez).
+    """
+    token, owner, repo, branch = _gh()
+    if not token:
+        return False, "Configure github.token em st.secrets (Streamlit Cloud → Settings → Secrets)."
+
+    api_url = f"{_gh_repo_url(owner, repo)}/contents/{path}"
     payload = {
         "message": message,
-        "content": base64.b64encode((txt or "").encode("utf-8")).decode("utf-8"),
+        "content": base64.b64encode(txt if isinstance(txt, bytes) else (txt or "").encode("utf-8")).decode("utf-8"),
         "branch": branch,
     }
-    if sha:
-        payload["sha"] = sha
 
-    r = requests.put(api_url, headers=_gh_headers(token), data=json.dumps(payload), timeout=20)
+    def _put(sha: str):
+        body = dict(payload)
+        if sha:
+            body["sha"] = sha
+        return _gh_request("PUT", api_url, headers=_gh_headers(token), data=json.dumps(body))
+
+    r = _put(_gh_known_sha(path) if base_sha is None else base_sha)
+    if r.status_code in (409, 422):
+        _sha_cache().pop(path, None)
+        if base_sha is not None:
+            return False, f"{GH_CONFLICT}: {path} foi alterado por outro commit"
+        # sha do cache desatualizado (outro device salvou antes): relê o sha e tenta uma vez
+        r = _put(_gh_known_sha(path))
+
     if r.status_code not in (200, 201):
-        st.error(f"Erro GitHub: {r.status_code} - {r.text}")
-        return False
-    return True
+        return False, f"Erro GitHub: {r.status_code} - {r.text}"
+
+    try:
+        _sha_cache()[path] = r.json().get("content", {}).get("sha", "")
+    except ValueError:
+        _sha_cache().pop(path, None)
+    return True, ""
+
+
+def gh_commit_files(files: dict[str, str | bytes], message: str, base_shas: dict[str, str] | None = None) -> tuple[bool, str]:
+    """
+    Commit set: grava vários arquivos num único commit via Git Data API
+    (blobs -> tree -> commit -> update do ref). Ou entra tudo, ou nada.
+    Com um arquivo só usa o PUT da Contents API (1 request em vez de 5+).
+    base_shas: {path: sha em que o conteúdo se baseou}; como no gh_put_file, se algum
+    desses arquivos mudou, retorna "Conflito: ..." em vez de sobrescrever.
+    Conteúdo None = apagar o arquivo no mesmo commit.
+    """
+    if not files:
+        return True, ""
+    if len(files) == 1 and None not in files.values():
+        (path, txt), = files.items()
+        return gh_put_file(path, txt, message, (base_shas or {}).get(path))
+
+    token, owner, repo, branch = _gh()
+    if not token:
+        return False, "Configure github.token em st.secrets (Streamlit Cloud → Settings → Secrets)."
+
+    base = _gh_repo_url(owner, repo)
+    headers = _gh_headers(token)
+
+    def _fail(r) -> tuple[bool, str]:
+        return False, f"Erro GitHub: {r.status_code} - {r.text}"
+
+    # blobs não dependem do ref: sobem uma vez só, mesmo se o update do ref precisar de retry
+    tree = []
+    for path, txt in files.items():
+        if txt is None:
+            tree.append({"path": path, "mode": "100644", "type": "blob", "sha": None})
+            continue
+        r = _gh_request(
+            "POST",
+            f"{base}/git/blobs",
+            headers=headers,
+            data=json.dumps({
+                "content": base64.b64encode(txt if isinstance(txt, bytes) else (txt or "").encode("utf-8")).decode("utf-8"),
+                "encoding": "base64",
+            }),
+        )
+        if r.status_code != 201:
+            return _fail(r)
+        tree.append({"path": path, "mode": "100644", "type": "blob", "sha": r.json().get("sha", "")})
+
+    for _ in range(2):
+        r = _gh_request("GET", f"{base}/git/ref/heads/{branch}", headers=headers)
+        if r.status_code != 200:
+            return _fail(r)
+        head_sha = r.json().get("object", {}).get("sha", "")
+
+        for path, sha in (base_shas or {}).items():
+            meta = _gh_file_meta(path)
+            if (meta or {}).get("sha", "") != sha:
+                return False, f"{GH_CONFLICT}: {path} foi alterado por outro commit"
+
+        r = _gh_request("GET", f"{base}/git/commits/{head_sha}", headers=headers)
+        if r.status_code != 200:
+            return _fail(r)
+        base_tree = r.json().get("tree", {}).get("sha", "")
+
+        r = _gh_request(
+            "POST",
+            f"{base}/git/trees",
+            headers=headers,
+            data=json.dumps({"base_tree": base_tree, "tree": tree}),
+        )
+        if r.status_code != 201:
+            return _fail(r)
+        tree_sha = r.json().get("sha", "")
+
+        r = _gh_request(
+            "POST",
+            f"{base}/git/commits",
+            headers=headers,
+            data=json.dumps({"message": message, "tree": tree_sha, "parents": [head_sha]}),
+        )
+        if r.status_code != 201:
+            return _fail(r)
+        commit_sha = r.json().get("sha", "")
+
+        r = _gh_request(
+            "PATCH",
+            f"{base}/git/refs/heads/{branch}",
+            headers=headers,
+            data=json.dumps({"sha": commit_sha, "force": False}),
+        )
+        if r.status_code == 200:
+            cache = _sha_cache()
+            for it in tree:
+                if it["sha"]:
+                    cache[it["path"]] = it["sha"]
+                else:
+                    cache.pop(it["path"], None)
+            return True, ""
+        if r.status_code != 422:
+            return _fail(r)
+        # 422 = não é fast-forward (outro commit entrou no meio): refaz tree/commit sobre o novo head
+
+    return _fail(r)
 
 
 def _clean_nans(df: pd.DataFrame) -> pd.DataFrame:
@@ -145,116 +515,1011 @@ def _clean_nans(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+def _parse_csv(txt, columns: list[str]) -> pd.DataFrame:
+    """txt pode ser o texto do CSV ou um stream de texto (download grande)."""
+    if isinstance(txt, str) or txt is None:
+        if not (txt or "").strip():
+            return pd.DataFrame(columns=columns)
+        txt = io.StringIO(txt)
+    try:
+        return pd.read_csv(txt)
+    except Exception:
+        return pd.DataFrame(columns=columns)
+
+
+@st.cache_resource
+def _parsed_cache() -> dict:
+    """path -> (sha, DataFrame já parseado): blob igual (ex.: 304) não é re-parseado."""
+    return {}
+
+
+def _gh_read_csv(path: str, parse) -> pd.DataFrame:
+    data = _gh_file_meta(path)
+    if data is None:
+        return parse("")
+    sha = data.get("sha", "")
+    cache = _parsed_cache()
+    hit = cache.get(path)
+    if sha and hit and hit[0] == sha:
+        return hit[1].copy()
+    if _gh_is_large(data):
+        # arquivo grande: o corpo vai em streaming para o read_csv, sem string base64 na memória
+        with _gh_open_raw(path) as f:
+            df = parse(f)
+    else:
+        content_b64 = data.get("content", "") or ""
+        df = parse(base64.b64decode(content_b64).decode("utf-8", errors="replace") if content_b64 else "")
+    if sha:
+        cache[path] = (sha, df)
+    return df.copy()
+
+
 # ============================================================
-# 2) LOG (Data/treino_log.csv) — persistência (auto-save)
+# 2) LOG (Data/treino_log.csv + Data/log/AAAA-MM.csv) — persistência (auto-save)
 # ============================================================
 GITHUB_LOG_PATH = "Data/treino_log.csv"
-LOG_COLUMNS = ["timestamp", "user", "dia", "grupo", "exercicio", "series_reps", "peso_kg", "feito"]
+GITHUB_LOG_DIR = "Data/log"
+GITHUB_LOG_SNAPSHOT_PATH = f"{GITHUB_LOG_DIR}/snapshot.parquet"
+GITHUB_LOG_LEGACY_PATH = "Data/Treino_log.csv"  # formato antigo (planejado/feito); só difere no "T"
+LOG_CATEGORY_COLUMNS = ["user", "dia", "grupo", "exercicio"]
+
+# versões do cabeçalho do log; series_reps = o que foi feito, series_reps_planejado = o do treino
+LOG_SCHEMA_VERSION = 2
+LOG_SCHEMAS = {
+    0: ["timestamp", "user", "dia", "grupo", "exercicio", "series_reps_planejado", "series_reps_feito", "peso_kg", "feito"],
+    1: ["timestamp", "user", "dia", "grupo", "exercicio", "series_reps", "peso_kg", "feito"],
+    2: ["timestamp", "user", "dia", "grupo", "exercicio", "series_reps", "series_reps_planejado", "peso_kg", "feito"],
+}
+LOG_SCHEMA_RENAMES = {0: {"series_reps_feito": "series_reps"}}
+LOG_COLUMNS = LOG_SCHEMAS[LOG_SCHEMA_VERSION]
+LOG_HEADER = ",".join(LOG_COLUMNS)
+
+
+def _log_mode() -> str:
+    """
+    "segments" (padrão): cada append vai para Data/log/AAAA-MM.csv (custo limitado ao mês).
+    "single": comportamento antigo, reescreve Data/treino_log.csv inteiro.
+    """
+    mode = str(st.secrets.get("github", {}).get("log_mode", "segments") or "segments").strip().lower()
+    return mode if mode in ("segments", "single") else "segments"
 
 
-# ✅ REFRESH: adiciona version param pra quebrar cache
-@st.cache_data(ttl=60)
-def load_history_from_github(version: int = 0) -> pd.DataFrame:
-    _ = int(version or 0)
-    txt, _ = gh_read_file(GITHUB_LOG_PATH)
-    if not (txt or "").strip():
-        return pd.DataFrame(columns=LOG_COLUMNS)
+def _auto_migrate_log() -> bool:
+    """
+    github.auto_migrate_log = true: o load migra o log antigo sozinho (regrava CSVs e
+    apaga o Treino_log.csv legado). Padrão: só avisa e a migração fica no `migrate-log`.
+    """
+    return bool(st.secrets.get("github", {}).get("auto_migrate_log", False))
 
-    try:
-        df = pd.read_csv(io.StringIO(txt))
-    except Exception:
-        return pd.DataFrame(columns=LOG_COLUMNS)
 
+def _log_segment_path(timestamp: str) -> str:
+    month = str(timestamp or "")[:7]
+    if len(month) != 7:
+        month = _now_utc_z()[:7]
+    return f"{GITHUB_LOG_DIR}/{month}.csv"
+
+
+def _log_defaults(df: pd.DataFrame) -> pd.DataFrame:
     for col in LOG_COLUMNS:
         if col not in df.columns:
             df[col] = "" if col not in ("peso_kg", "feito") else (0.0 if col == "peso_kg" else 0)
+    return df
 
-    df = df[LOG_COLUMNS].copy()
-    df = _clean_nans(df)
 
-    df["peso_kg"] = pd.to_numeric(df["peso_kg"], errors="coerce").fillna(0.0)
-    df["feito"] = pd.to_numeric(df["feito"], errors="coerce").fillna(0).astype(int)
-    for c in ["timestamp", "user", "dia", "grupo", "exercicio", "series_reps"]:
-        df[c] = df[c].astype(str)
+def _log_schema_of(header: str) -> int | None:
+    cols = [c.strip().lstrip("\ufeff") for c in (header or "").strip().split(",")]
+    return next((v for v, schema in LOG_SCHEMAS.items() if schema == cols), None)
+
+
+def _migrate_log_frame(df: pd.DataFrame, version: int | None) -> pd.DataFrame:
+    """Qualquer versão (ou cabeçalho desconhecido) -> colunas da versão atual, sem NaN."""
+    df = df.rename(columns=LOG_SCHEMA_RENAMES.get(version, {}))
+    return _clean_nans(_log_defaults(df)[LOG_COLUMNS])
+
+
+def _is_canonical_log(df: pd.DataFrame) -> bool:
+    return df.attrs.get("log_schema") == LOG_SCHEMA_VERSION
+
+
+def _parse_log_csv(txt) -> pd.DataFrame:
+    """
+    txt: texto ou stream. Cabeçalho da versão atual = caminho rápido: lê direto nas
+    colunas certas (texto sem NaN) e marca o frame como canônico, e o _typed_log não
+    precisa completar/limpar colunas. Versões antigas passam por _migrate_log_frame.
+    """
+    stream = io.StringIO(txt or "") if isinstance(txt, str) or txt is None else txt
+    header = stream.readline()
+    if not header.strip():
+        df = pd.DataFrame(columns=LOG_COLUMNS)
+        df.attrs.update(log_schema=LOG_SCHEMA_VERSION, log_source_schema=LOG_SCHEMA_VERSION)
+        return df
+    version = _log_schema_of(header)
+    if version == LOG_SCHEMA_VERSION:
+        df = pd.read_csv(stream, header=None, names=LOG_COLUMNS, dtype=str, keep_default_na=False)
+        df["peso_kg"] = pd.to_numeric(df["peso_kg"], errors="coerce").fillna(0.0)
+        df["feito"] = pd.to_numeric(df["feito"], errors="coerce").fillna(0).astype(int)
+    else:
+        names = [c.strip().lstrip("\ufeff") for c in header.strip().split(",")]
+        try:
+            df = pd.read_csv(stream, header=None, names=names)
+        except Exception:
+            df = pd.DataFrame(columns=names)
+        df = _migrate_log_frame(df, version)
+    df.attrs["log_schema"] = LOG_SCHEMA_VERSION
+    df.attrs["log_source_schema"] = version  # versão do arquivo lido (migrate_log_schema reescreve)
     return df
 
 
-def append_history_to_github(df_new: pd.DataFrame) -> bool:
-    # ✅ REFRESH: usa versão atual
-    df_old = load_history_from_github(st.session_state.v_log)
+def _log_source_files(listing: list[dict]) -> list[dict]:
+    """[{path, sha, size}] de todos os CSVs do log: arquivo único antigo + segmentos mensais."""
+    files = []
+    meta = _gh_file_meta(GITHUB_LOG_PATH)
+    if meta:
+        files.append({"path": GITHUB_LOG_PATH, "sha": meta.get("sha", ""), "size": int(meta.get("size", 0) or 0)})
+    for f in sorted(listing, key=lambda f: f["name"]):
+        if re.fullmatch(r"\d{4}-\d{2}\.csv", f["name"]):
+            files.append({"path": f["path"], "sha": f["sha"], "size": f["size"]})
+    return files
 
-    for col in LOG_COLUMNS:
-        if col not in df_new.columns:
-            df_new[col] = "" if col not in ("peso_kg", "feito") else (0.0 if col == "peso_kg" else 0)
-        if col not in df_old.columns:
-            df_old[col] = "" if col not in ("peso_kg", "feito") else (0.0 if col == "peso_kg" else 0)
 
-    df_old = df_old[LOG_COLUMNS].copy()
-    df_new = df_new[LOG_COLUMNS].copy()
+def _log_sources(listing: list[dict]) -> dict[str, str]:
+    """path -> sha dos CSVs do log."""
+    return {f["path"]: f["sha"] for f in _log_source_files(listing)}
 
-    df_old["peso_kg"] = pd.to_numeric(df_old["peso_kg"], errors="coerce").fillna(0.0)
-    df_new["peso_kg"] = pd.to_numeric(df_new["peso_kg"], errors="coerce").fillna(0.0)
 
-    df_old["feito"] = pd.to_numeric(df_old["feito"], errors="coerce").fillna(0).astype(int)
+def _git_blob_sha(data: bytes) -> str:
+    # mesmo sha que o GitHub devolve para o arquivo (dá para conferir um prefixo sem baixar nada)
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def _log_csv_tail(data: bytes, offset: int) -> str:
+    """Cabeçalho + bytes depois de offset (as linhas novas de um CSV append-only)."""
+    header = data.split(b"\n", 1)[0]
+    tail = data[offset:]
+    if not tail.strip():
+        return ""
+    return (header + b"\n" + tail).decode("utf-8", errors="replace")
+
+
+def _read_log_snapshot(sha: str, columns: list[str]) -> tuple[pd.DataFrame, dict]:
+    """
+    Lê só as colunas pedidas do snapshot Parquet. Retorna (df com coluna _src, {path: sha}
+    dos CSVs que ele cobre). Cacheado pelo sha do snapshot.
+    """
+    key = f"{GITHUB_LOG_SNAPSHOT_PATH}|{','.join(columns)}"
+    cache = _parsed_cache()
+    hit = cache.get(key)
+    if hit and hit[0] == sha:
+        df, covers = hit[1]
+        return df.copy(), covers
+
+    raw, _ = gh_read_bytes(GITHUB_LOG_SNAPSHOT_PATH)
+    meta = pq.read_schema(io.BytesIO(raw)).metadata or {}
+    if int(meta.get(b"log_schema", b"1")) != LOG_SCHEMA_VERSION:
+        # snapshot de um schema antigo: não cobre nada (os CSVs são lidos e ele é refeito)
+        df, covers = pd.DataFrame(columns=columns + ["_src"]), {}
+        cache[key] = (sha, (df, covers))
+        return df.copy(), covers
+    table = pq.read_table(io.BytesIO(raw), columns=columns + ["_src"])
+    covers = json.loads(meta.get(b"covers", b"{}"))
+    df = table.to_pandas()
+    cache[key] = (sha, (df, covers))
+    return df.copy(), covers
+
+
+def compact_log_snapshot() -> tuple[bool, str]:
+    """
+    Reescreve Data/log/snapshot.parquet com todo o log (CSV único + segmentos).
+    O loader passa a parsear só os CSVs que mudaram depois disso (normalmente o mês atual).
+    """
+    sources = _log_sources(gh_list_dir(GITHUB_LOG_DIR))
+    frames = [_gh_read_csv(p, _parse_log_csv).assign(_src=p) for p in sources]
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=LOG_COLUMNS + ["_src"])
+    df = pd.concat([_normalize_log_rows(df), df[["_src"]]], axis=1)
+    for c in LOG_CATEGORY_COLUMNS + ["_src"]:
+        df[c] = df[c].astype(str).astype("category")
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        b"covers": json.dumps(sources).encode("utf-8"),
+        b"log_schema": str(LOG_SCHEMA_VERSION).encode("utf-8"),
+    })
+    buf = io.BytesIO()
+    pq.write_table(table, buf, compression="zstd")
+    return gh_put_file(GITHUB_LOG_SNAPSHOT_PATH, buf.getvalue(), f"compact treino log snapshot {_now_utc_z()}")
+
+
+@st.cache_resource
+def _compaction_lock() -> threading.Lock:
+    return threading.Lock()
+
+
+def _compact_log_in_background():
+    lock = _compaction_lock()
+    if not lock.acquire(blocking=False):
+        return  # já tem uma compactação rodando
+
+    def _run():
+        try:
+            compact_log_snapshot()
+        except Exception:
+            pass  # tenta de novo no próximo load
+        finally:
+            lock.release()
+
+    threading.Thread(target=_run, name="log-compaction", daemon=True).start()
+
+
+def _log_migration_files(bases: dict) -> tuple[dict, int]:
+    """
+    ({path: conteúdo}, nº de arquivos migrados): CSVs do log em schema antigo regravados
+    no atual; as linhas do Data/Treino_log.csv legado entram no log como um append
+    normal (segmento do mês) e o arquivo é apagado no mesmo commit.
+    """
+    listing = gh_list_dir(GITHUB_LOG_DIR) if _log_mode() == "segments" else []
+    files = {}
+    for f in _log_source_files(listing):
+        txt, sha = gh_read_file(f["path"])
+        if not txt.strip() or _log_schema_of(txt.split("\n", 1)[0]) == LOG_SCHEMA_VERSION:
+            continue
+        bases[f["path"]] = sha
+        files[f["path"]] = _parse_log_csv(txt).to_csv(index=False, encoding="utf-8")
+
+    legacy_txt, legacy_sha = gh_read_file(GITHUB_LOG_LEGACY_PATH)
+    if legacy_sha:
+        bases[GITHUB_LOG_LEGACY_PATH] = legacy_sha
+        rows = _parse_log_csv(legacy_txt)
+        if not rows.empty:
+            files.update(_log_append_files(rows, bases))
+        files[GITHUB_LOG_LEGACY_PATH] = None
+    return files, len(files)
+
+
+def migrate_log_schema() -> tuple[bool, str]:
+    """Migração única do log para LOG_SCHEMA_VERSION (um commit; conflito = refaz)."""
+    ok, err = False, ""
+    for attempt in range(MERGE_RETRIES):
+        bases = {}
+        files, n = _log_migration_files(bases)
+        if not files:
+            return True, f"log já no schema v{LOG_SCHEMA_VERSION}"
+        ok, err = gh_commit_files(files, f"migrate treino log to schema v{LOG_SCHEMA_VERSION} {_now_utc_z()}", base_shas=bases)
+        if ok:
+            _note_log_write(files)
+            return True, f"{n} arquivo(s) migrado(s) para o schema v{LOG_SCHEMA_VERSION}"
+        if not _is_conflict(err):
+            break
+        _merge_backoff(attempt)
+    return ok, err
+
+
+@st.cache_resource
+def _migration_state() -> dict:
+    # legacy_absent: Treino_log.csv já não existe (nada mais o cria): não pergunta de novo à API
+    # status (aviso na tela): "" | "pendente" | "migrando" | "ok: ..." | "erro: ..."
+    return {"lock": threading.Lock(), "tried": False, "legacy_absent": False, "status": ""}
+
+
+def _legacy_log_exists() -> bool:
+    """Treino_log.csv ainda no repo? O 404 não passa pelo cache de ETag: a ausência fica lembrada."""
+    state = _migration_state()
+    if state["legacy_absent"]:
+        return False
+    if _gh_file_meta(GITHUB_LOG_LEGACY_PATH):
+        return True
+    state["legacy_absent"] = True
+    return False
+
+
+def _migrate_log_in_background():
+    state = _migration_state()
+    if state["tried"] or not state["lock"].acquire(blocking=False):
+        return  # uma tentativa por processo (o loader lê o formato antigo do mesmo jeito)
+    state["tried"] = True
+    state["status"] = "migrando"
+
+    def _run():
+        try:
+            ok, msg = migrate_log_schema()
+            state["status"] = f"ok: {msg}" if ok else f"erro: {msg}"
+            if ok:
+                state["legacy_absent"] = True  # a migração apaga o legado
+                _bump_version("log")
+        except Exception as e:
+            state["status"] = f"erro: {e}"
+        finally:
+            state["lock"].release()
+
+    threading.Thread(target=_run, name="log-migration", daemon=True).start()
+
+
+def _load_log_github(columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Snapshot Parquet (só as colunas pedidas) + os CSVs que mudaram depois dele.
+    Sem snapshot (ou log_mode "single") cai no parse de todos os CSVs.
+    """
+    cols = list(columns or LOG_COLUMNS)
+    listing = gh_list_dir(GITHUB_LOG_DIR) if _log_mode() == "segments" else []
+    # o arquivo único antigo continua sendo lido (histórico anterior aos segmentos)
+    sources = _log_sources(listing)
+
+    frames = []
+    covered = set()
+    snap = next((f for f in listing if f["path"] == GITHUB_LOG_SNAPSHOT_PATH), None)
+    if snap:
+        df_snap, covers = _read_log_snapshot(snap["sha"], cols)
+        # linhas de um CSV que mudou depois do snapshot são descartadas e o CSV é relido inteiro
+        covered = {p for p, sha in covers.items() if sources.get(p) == sha}
+        frames.append(df_snap[df_snap["_src"].isin(covered)].drop(columns="_src"))
+
+    tail = [p for p in sources if p not in covered]
+    frames += [_gh_read_csv(p, _parse_log_csv)[cols] for p in tail]
+
+    # CSVs de meses já fechados fora do snapshot: compacta em segundo plano
+    if listing and any(p != _log_segment_path(_now_utc_z()) for p in tail):
+        _compact_log_in_background()
+
+    # CSV no formato antigo (ou o Treino_log.csv legado): o loader lê assim mesmo; a
+    # migração regrava/apaga arquivos do repo, então só roda sozinha se configurado
+    outdated = [f for f in frames if f.attrs.get("log_source_schema", LOG_SCHEMA_VERSION) != LOG_SCHEMA_VERSION]
+    state = _migration_state()
+    if not state["tried"] and (outdated or _legacy_log_exists()):
+        if _auto_migrate_log():
+            _migrate_log_in_background()
+        else:
+            state["status"] = "pendente"
+    elif state["status"] == "pendente":
+        state["status"] = ""  # migrado por fora (CLI)
+
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        df = pd.DataFrame(columns=cols)
+    else:
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    df.attrs["log_schema"] = LOG_SCHEMA_VERSION  # snapshot e CSVs já vêm no schema atual
+    return df
+
+
+def _typed_log(df: pd.DataFrame, columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Log tipado e compacto: textos repetidos viram category, timestamp vira datetime UTC,
+    peso_kg float32 e feito int8; já ordenado por timestamp (índice 0..n-1).
+    columns: projeção (só essas colunas, na ordem de LOG_COLUMNS).
+    """
+    cols = [c for c in LOG_COLUMNS if not columns or c in columns]
+    if _is_canonical_log(df):
+        df = df[cols].copy()  # já no schema atual: nada a completar
+    else:
+        df = _clean_nans(_log_defaults(df)[cols].copy())
+
+    if "timestamp" in cols:
+        df["timestamp"] = pd.to_datetime(df["timestamp"].astype(str), utc=True, errors="coerce", format="ISO8601")
+    if "peso_kg" in cols:
+        df["peso_kg"] = pd.to_numeric(df["peso_kg"], errors="coerce").fillna(0.0).astype("float32")
+    if "feito" in cols:
+        df["feito"] = pd.to_numeric(df["feito"], errors="coerce").fillna(0).astype("int8")
+    for c in ("series_reps", "series_reps_planejado"):
+        if c in cols:
+            df[c] = df[c].astype(str)
+    for c in LOG_CATEGORY_COLUMNS:
+        if c in cols:
+            df[c] = df[c].astype(str).astype("category")
+    if "timestamp" in cols:
+        df = df.sort_values("timestamp", kind="stable", na_position="first")
+    return df.reset_index(drop=True)
+
+
+def _concat_log(df: pd.DataFrame, df_new: pd.DataFrame) -> pd.DataFrame:
+    """Junta linhas novas (já tipadas) ao log sem perder os dtypes category nem a ordenação."""
+    if df_new.empty:
+        return df
+    df_new = df_new.copy()
+    for c in LOG_CATEGORY_COLUMNS:
+        if c in df.columns:
+            # add_categories mantém os códigos do frame grande (não recodifica o histórico)
+            extra = df_new[c].cat.categories.difference(df[c].cat.categories)
+            if len(extra):
+                df[c] = df[c].cat.add_categories(extra)
+            df_new[c] = df_new[c].cat.set_categories(df[c].cat.categories)
+    out = pd.concat([df, df_new], ignore_index=True)
+    if "timestamp" in out.columns and len(df) and df_new["timestamp"].min() < df["timestamp"].iloc[-1]:
+        out = out.sort_values("timestamp", kind="stable", na_position="first").reset_index(drop=True)
+    return out
+
+
+class _IncrementalLog:
+    """
+    Log tipado já parseado, compartilhado pelo processo. Guarda uma marca por fonte
+    (GitHub: (sha, bytes) de cada CSV; SQLite: último id) e, quando algo muda, só as
+    linhas depois da marca são lidas. Gravações feitas por este processo entram direto
+    (note_write), sem baixar nem parsear nada.
+    """
+
+    def __init__(self, columns: list[str] | None):
+        self.columns = columns
+        self.lock = threading.Lock()
+        self.df: pd.DataFrame | None = None
+        self.marks: dict = {}
+        self.rollup: pd.DataFrame | None = None  # só depois do primeiro rollups()
+
+    def get(self, storage) -> pd.DataFrame:
+        with self.lock:
+            return self._refresh(storage)
+
+    def _refresh(self, storage) -> pd.DataFrame:
+        marks = storage.log_marks()
+        if self.df is not None and marks != self.marks:
+            delta = storage.load_log_delta(self.marks, marks, self.columns)
+            if delta is None:
+                self.df = None  # fonte reescrita (não é só append): recarrega tudo
+            else:
+                self._append(_typed_log(delta, self.columns))
+        if self.df is None:
+            self.df = _typed_log(storage.load_table("log", self.columns), self.columns)
+            self.rollup = None
+        self.marks = marks
+        return self.df
+
+    def _append(self, rows: pd.DataFrame):
+        self.df = _concat_log(self.df, rows)
+        if self.rollup is not None and not rows.empty:
+            self.rollup = _update_rollups(self.rollup, rows, self._since)
+
+    def _since(self, day: str) -> pd.DataFrame:
+        return self.df[self.df["timestamp"] >= pd.Timestamp(day, tz="UTC")]
+
+    def rollups(self, storage) -> pd.DataFrame:
+        """Rollups semana/mês do log (precisa das colunas todas: columns=None)."""
+        with self.lock:
+            df = self._refresh(storage)
+            if self.rollup is None:
+                self.rollup = _rollup_rows(df)
+            return self.rollup
+
+    def note_write(self, files: dict[str, str]):
+        """Arquivos do log recém-gravados por nós: {path: texto completo}."""
+        with self.lock:
+            if self.df is None:
+                return
+            for path, txt in files.items():
+                data = (txt or "").encode("utf-8")
+                old = self.marks.get(path)
+                if old is None:
+                    rows = _parse_log_csv(txt)
+                elif len(data) >= old[1] and _git_blob_sha(data[:old[1]]) == old[0]:
+                    rows = _parse_log_csv(_log_csv_tail(data, old[1]))
+                else:
+                    continue  # não é append do que já temos: get() resolve pela marca
+                self._append(_typed_log(rows, self.columns))
+                self.marks[path] = (_git_blob_sha(data), len(data))
+
+
+@st.cache_resource
+def _incremental_logs() -> dict:
+    """columns (tuple ou None) -> _IncrementalLog."""
+    return {}
+
+
+def _incremental_log(columns: tuple | None) -> _IncrementalLog:
+    logs = _incremental_logs()
+    if columns not in logs:
+        logs[columns] = _IncrementalLog(list(columns) if columns else None)
+    return logs[columns]
+
+
+def _note_log_write(files: dict[str, str]):
+    log_files = {
+        p: t for p, t in files.items()
+        if p == GITHUB_LOG_PATH or (p.startswith(GITHUB_LOG_DIR + "/") and p.endswith(".csv"))
+    }
+    if log_files:
+        for inc in list(_incremental_logs().values()):
+            inc.note_write(log_files)
+
+
+# ✅ REFRESH: adiciona version param pra quebrar cache
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=8)
+def load_history_from_github(version: str = "", columns: tuple | None = None) -> pd.DataFrame:
+    """
+    columns: só essas colunas (o snapshot Parquet/SQLite nem lê as outras).
+    Depois do primeiro load, só as linhas novas são lidas (_IncrementalLog).
+    """
+    _ = version
+    return _incremental_log(tuple(columns) if columns else None).get(_storage())
+
+
+def _normalize_log_rows(df_new: pd.DataFrame) -> pd.DataFrame:
+    df_new = _log_defaults(df_new.copy())[LOG_COLUMNS].copy()
+    df_new["peso_kg"] = pd.to_numeric(df_new["peso_kg"], errors="coerce").fillna(0.0)
     df_new["feito"] = pd.to_numeric(df_new["feito"], errors="coerce").fillna(0).astype(int)
+    return _clean_nans(df_new)
 
-    df_all = pd.concat([df_old, df_new], ignore_index=True)
+
+def _log_segment_files(df_new: pd.DataFrame, bases: dict | None = None) -> dict[str, str]:
+    """
+    Append-only: só o segmento do mês é lido, e as linhas novas são
+    concatenadas ao texto CSV (sem re-parsear nem re-serializar o histórico).
+    Retorna {path: novo_texto} para gravar; bases recebe {path: sha lido}.
+    """
+    df_new = _normalize_log_rows(df_new)
+    seg_of = df_new["timestamp"].astype(str).map(_log_segment_path)
+
+    files = {}
+    for seg_path, df_seg in df_new.groupby(seg_of, sort=True):
+        txt, sha = gh_read_file(seg_path)
+        if bases is not None:
+            bases[seg_path] = sha
+        if txt.strip() and _log_schema_of(txt.split("\n", 1)[0]) != LOG_SCHEMA_VERSION:
+            # segmento ainda no schema antigo: regrava no atual antes de anexar
+            txt = _parse_log_csv(txt).to_csv(index=False, encoding="utf-8")
+        has_header = bool((txt or "").strip())
+        chunk = df_seg.to_csv(index=False, header=not has_header, encoding="utf-8")
+        if has_header and not txt.endswith("\n"):
+            txt += "\n"
+        files[seg_path] = (txt if has_header else "") + chunk
+    return files
+
+
+def _log_single_files(df_new: pd.DataFrame, bases: dict | None = None) -> dict[str, str]:
+    txt, sha = gh_read_file(GITHUB_LOG_PATH)
+    if bases is not None:
+        bases[GITHUB_LOG_PATH] = sha
+    df_old = _parse_log_csv(txt)
+    df_all = pd.concat([_normalize_log_rows(df_old), _normalize_log_rows(df_new)], ignore_index=True)
     df_all = _clean_nans(df_all)
+    return {GITHUB_LOG_PATH: df_all.to_csv(index=False, encoding="utf-8")}
+
+
+def _log_append_files(df_new: pd.DataFrame, bases: dict | None = None) -> dict[str, str]:
+    """CSVs do log com as linhas novas (normalmente só o segmento do mês: um PUT)."""
+    if _log_mode() == "segments":
+        return _log_segment_files(df_new, bases)
+    return _log_single_files(df_new, bases)
 
-    csv_txt = df_all.to_csv(index=False, encoding="utf-8")
-    ok = gh_write_file(GITHUB_LOG_PATH, csv_txt, f"append treino log {_now_utc_z()}")
+
+MERGE_RETRIES = 4
+TABLE_WRITE_COALESCE_SECONDS = 0.3
+
+
+def _merge_backoff(attempt: int):
+    time.sleep(min(0.5 * (2 ** attempt), 4.0))
+
+
+def _append_log_github(df_new: pd.DataFrame) -> tuple[bool, str]:
+    """
+    Conflito (outro device gravou o mesmo segmento antes): relê o segmento e
+    reaplica as linhas novas por cima, com backoff, até MERGE_RETRIES vezes.
+    """
+    ok, err = False, ""
+    for attempt in range(MERGE_RETRIES):
+        bases = {}
+        files = _log_append_files(df_new, bases)
+        # segmentos de meses diferentes entram no mesmo commit
+        ok, err = gh_commit_files(files, f"append treino log {_now_utc_z()}", base_shas=bases)
+        if ok:
+            _note_log_write(files)
+            return ok, err
+        if not _is_conflict(err):
+            break
+        _merge_backoff(attempt)
+    return ok, err
+
+
+def _append_log_rows(df_new: pd.DataFrame) -> tuple[bool, str]:
+    """Grava linhas no log sem tocar em st.session_state (seguro fora da thread do Streamlit)."""
+    ok, err = _storage().append_log(_normalize_log_rows(df_new))
     if ok:
-        # ✅ REFRESH: limpa cache + incrementa versão
-        load_history_from_github.clear()
-        st.session_state.v_log += 1
-    return ok
+        _bump_version("log")
+    return ok, err
 
 
-def _autolog_debounced(user: str, day: str, group: str, exercise_name: str, reps_done: str, weight: float, done: bool):
+# ============================================================
+# 2B) Autolog: fila write-behind (worker em background)
+# ============================================================
+AUTOLOG_FLUSH_SECONDS = 10.0
+
+
+class _AutologQueue:
     """
-    Auto-salva no treino_log.csv com debounce (evita spammar commits no GitHub).
+    Buffer de eventos do screen_treino, coalescidos por (user, dia, exercicio):
+    só o último estado de cada exercício vira linha no log. Um worker em background
+    faz um commit a cada AUTOLOG_FLUSH_SECONDS (ou quando request_flush() é chamado
+    ao sair da tela). Os eventos pendentes ficam também num journal em disco, então
+    um restart do processo não perde edições.
     """
-    k = f"__last_autosave__{user}__{day}"
-    now = time.time()
-    last = float(st.session_state.get(k, 0.0) or 0.0)
-    if now - last < 1.2:
-        return
-    st.session_state[k] = now
-
-    df_new = pd.DataFrame(
-        [{
-            "timestamp": _now_utc_z(),
-            "user": user,
-            "dia": day,
-            "grupo": group,
-            "exercicio": exercise_name,
-            "series_reps": str(reps_done or "").strip(),
-            "peso_kg": float(weight or 0.0),
-            "feito": int(bool(done)),
-        }],
-        columns=LOG_COLUMNS
+
+    def __init__(self, journal_path: str, flush_seconds: float):
+        self.journal_path = journal_path
+        self.flush_seconds = float(flush_seconds)
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.pending: dict[tuple, dict] = {}
+        self.oldest = 0.0
+        self.last_error = ""
+        self._load_journal()
+        self.worker = threading.Thread(target=self._run, name="autolog-writer", daemon=True)
+        self.worker.start()
+
+    def _load_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        row = json.loads(line)
+                        self.pending[self._key(row)] = row
+        except (OSError, ValueError):
+            return
+        if self.pending:
+            self.oldest = time.time()
+
+    @staticmethod
+    def _key(row: dict) -> tuple:
+        return (row.get("user", ""), row.get("dia", ""), row.get("exercicio", ""))
+
+    def _rewrite_journal(self):
+        tmp = self.journal_path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                for row in self.pending.values():
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            os.replace(tmp, self.journal_path)
+        except OSError:
+            pass
+
+    def put(self, row: dict):
+        with self.lock:
+            if not self.pending:
+                self.oldest = time.time()
+            self.pending[self._key(row)] = row
+            try:
+                with open(self.journal_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            except OSError:
+                pass
+
+    def request_flush(self):
+        self.wake.set()
+
+    def pending_count(self) -> int:
+        with self.lock:
+            return len(self.pending)
+
+    def flush(self) -> bool:
+        with self.lock:
+            if not self.pending:
+                return True
+            batch = dict(self.pending)
+
+        df_new = pd.DataFrame(list(batch.values()), columns=LOG_COLUMNS)
+        df_new = df_new.sort_values("timestamp", kind="stable")
+        try:
+            ok, err = _append_log_rows(df_new)
+        except Exception as e:  # rede/GitHub fora do ar: tenta de novo no próximo ciclo
+            ok, err = False, f"{type(e).__name__}: {e}"
+
+        with self.lock:
+            if ok:
+                # remove só o que foi gravado (eventos novos do mesmo exercício continuam pendentes)
+                for k, row in batch.items():
+                    if self.pending.get(k) is row:
+                        del self.pending[k]
+                self.last_error = ""
+                self.oldest = time.time() if self.pending else 0.0
+                self._rewrite_journal()
+            else:
+                self.last_error = err
+        return ok
+
+    def _run(self):
+        while True:
+            self.wake.wait(timeout=1.0)
+            forced = self.wake.is_set()
+            self.wake.clear()
+            with self.lock:
+                due = bool(self.pending) and (forced or time.time() - self.oldest >= self.flush_seconds)
+            if due and not self.flush():
+                time.sleep(self.flush_seconds)
+
+
+@st.cache_resource
+def _autolog_queue() -> _AutologQueue:
+    _, owner, repo, branch = _gh()
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", f"gym_autolog_{owner}_{repo}_{branch}.jsonl")
+    return _AutologQueue(os.path.join(tempfile.gettempdir(), name), AUTOLOG_FLUSH_SECONDS)
+
+
+def _autolog_enqueue(
+    user: str, day: str, group: str, exercise_name: str, reps_done: str, weight: float, done: bool, reps_planned: str = "",
+):
+    """
+    Enfileira o estado atual do exercício para o worker gravar no log (retorna na hora).
+    """
+    _autolog_queue().put({
+        "timestamp": _now_utc_z(),
+        "user": user,
+        "dia": day,
+        "grupo": group,
+        "exercicio": exercise_name,
+        "series_reps": str(reps_done or "").strip(),
+        "series_reps_planejado": str(reps_planned or "").strip(),
+        "peso_kg": float(weight or 0.0),
+        "feito": int(bool(done)),
+    })
+
+
+# ============================================================
+# 2C) Rollups (semana/mês por user × exercicio) mantidos a cada append
+#     GitHub: em memória, a partir das linhas novas do _IncrementalLog (o append
+#     continua sendo um PUT do segmento do mês). SQLite: tabela log_rollup.
+# ============================================================
+# versão anterior gravava o rollup no repo a cada append; rebuild-rollups apaga o que sobrou
+GITHUB_LOG_ROLLUP_PATH = f"{GITHUB_LOG_DIR}/rollups.parquet"
+ROLLUP_KEYS = ["user", "exercicio", "dia", "periodo", "inicio"]
+ROLLUP_COLUMNS = ROLLUP_KEYS + [
+    "peso_max", "volume", "sessoes", "feitos",
+    "primeiro_dia", "ultimo_dia", "peso_max_ant", "ultimo_peso", "ultimo_volume", "ultimo_feito",
+]
+ROLLUP_PERIODS = {"semana": "W", "mes": "M"}
+
+
+def _empty_rollups() -> pd.DataFrame:
+    return pd.DataFrame(columns=ROLLUP_COLUMNS)
+
+
+def _rollup_rows(df_log: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rollup parcial de um pedaço do log (semana e mês). Como nos gráficos, cada
+    (user, exercicio, dia, data) conta uma sessão, com o último registro do dia.
+    ultimo_* guarda a contribuição do último dia (peso_max_ant = maior peso dos dias
+    anteriores): um append no mesmo dia substitui essa contribuição.
+    Datas em texto (AAAA-MM-DD) para o merge e o Parquet/SQLite.
+    """
+    df = _typed_log(df_log, ("timestamp", "user", "dia", "exercicio", "series_reps", "peso_kg", "feito"))
+    df = df[df["exercicio"].astype(str).ne("") & df["timestamp"].notna()]
+    if df.empty:
+        return _empty_rollups()
+    df = df.assign(data=df["timestamp"].dt.tz_localize(None).dt.normalize())
+    df = df.drop_duplicates(["user", "exercicio", "dia", "data"], keep="last").reset_index(drop=True)
+    reps = _series_reps_table(df["series_reps"])
+    df["volume"] = (df["peso_kg"].astype("float64") * reps["reps_total"]).fillna(0.0)
+    df["dia_txt"] = df["data"].dt.strftime("%Y-%m-%d")
+    for c in ("user", "exercicio", "dia"):
+        df[c] = df[c].astype(str)
+
+    out = []
+    for periodo, freq in ROLLUP_PERIODS.items():
+        inicio = df["data"].dt.to_period(freq).dt.start_time.dt.strftime("%Y-%m-%d")
+        agg = (
+            df.assign(periodo=periodo, inicio=inicio)
+            .groupby(ROLLUP_KEYS, sort=False)
+            .agg(
+                peso_max=("peso_kg", "max"), volume=("volume", "sum"), sessoes=("data", "size"),
+                feitos=("feito", "sum"), primeiro_dia=("dia_txt", "min"), ultimo_dia=("dia_txt", "max"),
+                ultimo_peso=("peso_kg", "last"), ultimo_volume=("volume", "last"), ultimo_feito=("feito", "last"),
+            )
+            .reset_index()
+        )
+        # maior peso sem contar o último dia do período
+        last = df.assign(inicio=inicio).duplicated(ROLLUP_KEYS[:3] + ["inicio"], keep="last")
+        ant = (
+            df[last].assign(periodo=periodo, inicio=inicio[last])
+            .groupby(ROLLUP_KEYS, sort=False)["peso_kg"].max().rename("peso_max_ant")
+        )
+        agg = agg.join(ant, on=ROLLUP_KEYS)
+        out.append(agg)
+    return _rollup_types(pd.concat(out, ignore_index=True))
+
+
+def _rollup_types(df: pd.DataFrame) -> pd.DataFrame:
+    df = df[ROLLUP_COLUMNS].copy()
+    for c in ("peso_max", "volume", "peso_max_ant", "ultimo_peso", "ultimo_volume"):
+        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0.0).astype("float64").round(2)
+    for c in ("sessoes", "feitos", "ultimo_feito"):
+        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0).astype("int64")
+    for c in ROLLUP_KEYS + ["primeiro_dia", "ultimo_dia"]:
+        df[c] = df[c].astype(str)
+    return df
+
+
+def _merge_rollups(old: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    """
+    old + rollup das linhas novas, supondo que em cada chave elas vêm no último dia já
+    contado ou depois (quem chama confere: _update_rollups). Só as chaves de new mudam.
+    """
+    if old is None or old.empty:
+        return new
+    if new.empty:
+        return old
+    m = old.merge(new, on=ROLLUP_KEYS, how="outer", suffixes=("", "_n"), indicator=True)
+    only_new = m["_merge"] == "right_only"
+    both = m["_merge"] == "both"
+    # o último dia de old continuou em new: a contribuição antiga daquele dia sai
+    same_day = both & (m["ultimo_dia"] == m["primeiro_dia_n"])
+
+    out = m[ROLLUP_KEYS].copy()
+    for c in ("volume", "sessoes", "feitos"):
+        out[c] = m[c].fillna(0) + m[f"{c}_n"].fillna(0)
+    out.loc[same_day, "volume"] -= m.loc[same_day, "ultimo_volume"]
+    out.loc[same_day, "sessoes"] -= 1
+    out.loc[same_day, "feitos"] -= m.loc[same_day, "ultimo_feito"]
+    out["primeiro_dia"] = m["primeiro_dia"].where(~only_new, m["primeiro_dia_n"])
+    has_new = m["_merge"] != "left_only"
+    for c in ("ultimo_dia", "ultimo_peso", "ultimo_volume", "ultimo_feito"):
+        out[c] = m[f"{c}_n"].where(has_new, m[c])
+    # dias anteriores: os de old (+ o último de old, se new não o substituiu) e os de new
+    old_last = m["ultimo_peso"].where(both & ~same_day)
+    out["peso_max_ant"] = pd.concat([m["peso_max_ant"], old_last, m["peso_max_ant_n"]], axis=1).max(axis=1)
+    out["peso_max"] = out[["peso_max_ant", "ultimo_peso"]].max(axis=1)
+    return _rollup_types(out)
+
+
+def _update_rollups(old: pd.DataFrame | None, rows: pd.DataFrame, log_since) -> pd.DataFrame:
+    """
+    old + linhas novas do log. Linha mais antiga que o último dia já contado na mesma
+    chave (legado migrado, journal do autolog reprocessado depois de um restart) não
+    pode ir pelo merge: os períodos a partir do mais antigo tocado pelas linhas novas
+    são recalculados com log_since(inicio) (o log inteiro a partir dessa data, já com
+    as linhas novas). Mesmo resultado de um rebuild.
+    """
+    new = _rollup_rows(rows)
+    if new.empty:
+        return old if old is not None else _empty_rollups()
+    if old is None or old.empty:
+        return new
+    old_last = new.join(old.set_index(ROLLUP_KEYS)["ultimo_dia"].rename("old_last"), on=ROLLUP_KEYS)["old_last"]
+    if not (new["primeiro_dia"] < old_last.fillna("")).any():
+        return _merge_rollups(old, new)
+    since = new["inicio"].min()
+    fresh = _rollup_rows(log_since(since))
+    return _rollup_types(pd.concat([old[old["inicio"] < since], fresh[fresh["inicio"] >= since]], ignore_index=True))
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=8)
+def load_rollups(version: str = "") -> pd.DataFrame:
+    """
+    Rollups prontos para as telas (inicio como data, taxa_feito = feitos/sessoes).
+    Sem tabela de rollup no storage (GitHub), vêm do log em memória do processo:
+    calculados uma vez e depois só atualizados com as linhas novas de cada versão.
+    """
+    _ = version
+    storage = _storage()
+    df = storage.load_rollups()
+    if df is None:
+        df = _incremental_log(None).rollups(storage)
+    df = df[ROLLUP_KEYS + ["peso_max", "volume", "sessoes", "feitos"]].copy()
+    df["inicio"] = pd.to_datetime(df["inicio"])
+    df["taxa_feito"] = (df["feitos"] / df["sessoes"].where(df["sessoes"] > 0)).fillna(0.0).round(2)
+    return df.sort_values(["periodo", "inicio", "exercicio"], ascending=[True, False, True], kind="stable").reset_index(drop=True)
+
+
+# ============================================================
+# 2D) Sessões: log canônico (estado final por exercício) + arquivo dos eventos
+# ============================================================
+GITHUB_LOG_ARCHIVE_DIR = f"{GITHUB_LOG_DIR}/raw"
+SESSION_GAP_HOURS = 3  # mais que isso sem evento no mesmo (user, dia) = outra sessão
+
+
+def _session_final_mask(df: pd.DataFrame) -> pd.Series:
+    """
+    True nas linhas que sobrevivem à compactação. Eventos do mesmo (user, dia) com
+    intervalos de até SESSION_GAP_HOURS formam uma sessão (treino que passa da
+    meia-noite continua a mesma); de cada exercício na sessão fica o último evento.
+    """
+    ts = pd.to_datetime(df["timestamp"].astype(str), utc=True, errors="coerce", format="ISO8601")
+    d = pd.DataFrame(
+        {"user": df["user"].astype(str), "dia": df["dia"].astype(str), "ex": df["exercicio"].astype(str), "ts": ts},
+        index=df.index,
+    ).sort_values(["user", "dia", "ts"], kind="stable")
+    novo = (
+        (d["ts"].diff() > pd.Timedelta(hours=SESSION_GAP_HOURS))
+        | (d["user"] != d["user"].shift())
+        | (d["dia"] != d["dia"].shift())
     )
-    append_history_to_github(df_new)
+    d["sessao"] = novo.cumsum()
+    keep = ~d.duplicated(["sessao", "ex"], keep="last") | d["ts"].isna()  # sem timestamp: não mexe
+    return keep.reindex(df.index)
+
+
+def _archive_path(path: str) -> str:
+    return f"{GITHUB_LOG_ARCHIVE_DIR}/{os.path.basename(path)}"
+
+
+def _log_session_files(bases: dict) -> tuple[dict, int]:
+    """
+    ({path: conteúdo}, nº de eventos arquivados) para reescrever os CSVs do log na forma
+    canônica. Os eventos que saem vão para Data/log/raw/<mesmo nome> (append), então
+    canônico + arquivo = eventos brutos. Sessionização é global (sessão pode cruzar o mês).
+    """
+    listing = gh_list_dir(GITHUB_LOG_DIR) if _log_mode() == "segments" else []
+    frames = []
+    for f in _log_source_files(listing):
+        txt, sha = gh_read_file(f["path"])
+        bases[f["path"]] = sha
+        frames.append(_normalize_log_rows(_parse_log_csv(txt)).assign(_src=f["path"]))
+    if not frames:
+        return {}, 0
+    df = pd.concat(frames, ignore_index=True)
+    keep = _session_final_mask(df)
+
+    files, archived = {}, 0
+    for path, part in df.groupby("_src", sort=False):
+        drop = part[~keep[part.index]]
+        if drop.empty:
+            continue
+        archived += len(drop)
+        files[path] = part[keep[part.index]][LOG_COLUMNS].to_csv(index=False, encoding="utf-8")
+        arch = _archive_path(path)
+        old_txt, arch_sha = gh_read_file(arch)
+        if arch_sha:
+            bases[arch] = arch_sha
+        new_txt = drop[LOG_COLUMNS].to_csv(index=False, header=not old_txt.strip(), encoding="utf-8")
+        files[arch] = (old_txt if old_txt.endswith("\n") or not old_txt else old_txt + "\n") + new_txt
+    return files, archived
+
+
+def compact_log_sessions() -> tuple[bool, str]:
+    """
+    Reescreve o log no GitHub na forma canônica (um commit). Se alguém gravar no log
+    no meio, o commit dá conflito e a compactação é refeita do zero.
+    """
+    ok, err = False, ""
+    for attempt in range(MERGE_RETRIES):
+        bases = {}
+        files, archived = _log_session_files(bases)
+        if not files:
+            return True, "0 eventos arquivados"
+        ok, err = gh_commit_files(files, f"compact treino log sessions {_now_utc_z()}", base_shas=bases)
+        if ok:
+            return True, f"{archived} eventos arquivados"
+        if not _is_conflict(err):
+            break
+        _merge_backoff(attempt)
+    return ok, err
 
 
 # ============================================================
 # 3) Treinos em CSV (Data/treinos.csv)
 # ============================================================
 GITHUB_TREINOS_PATH = "Data/treinos.csv"
-TREINOS_COLUMNS = ["user", "dia", "ordem", "grupo", "exercicio", "series_reps", "gif_key", "alt_group"]
+TREINOS_COLUMNS = ["user", "dia", "ordem", "grupo", "exercicio", "series_reps", "gif_key", "alt_group", "row_id"]
+TREINO_ID_LEN = 12
 
 
-# ✅ REFRESH: adiciona version param pra quebrar cache
-@st.cache_data(ttl=60)
-def load_treinos_from_github(version: int = 0) -> pd.DataFrame:
-    _ = int(version or 0)
-    txt, _ = gh_read_file(GITHUB_TREINOS_PATH)
-    if not (txt or "").strip():
-        return pd.DataFrame(columns=TREINOS_COLUMNS)
+def _new_row_id() -> str:
+    return os.urandom(TREINO_ID_LEN // 2).hex()
 
-    try:
-        df = pd.read_csv(io.StringIO(txt))
-    except Exception:
+
+def _treino_row_ids(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    row_id: identidade estável da linha (edição/remoção/merge não dependem de
+    (ordem, exercicio), que pode repetir). Linha sem id (CSV antigo, edição à mão)
+    ou com id repetido ganha um hash determinístico de (user, dia, ordem, exercicio, nº
+    da repetição): recarregar o mesmo arquivo dá os mesmos ids até o próximo save gravá-los.
+    """
+    ids = df["row_id"].astype(str).str.strip()
+    fix = (ids == "") | ids.duplicated(keep="first")
+    if fix.any():
+        sub = df.loc[fix, ["user", "dia", "ordem", "exercicio"]].astype(str)
+        nth = sub.groupby(list(sub.columns), sort=False).cumcount().astype(str)
+        seeds = sub["user"] + "|" + sub["dia"] + "|" + sub["ordem"] + "|" + sub["exercicio"] + "|" + nth
+        hashed = pd.Series([hashlib.sha1(x.encode("utf-8")).hexdigest()[:TREINO_ID_LEN] for x in seeds], index=seeds.index)
+        ids = ids.where(~fix, hashed)
+    df["row_id"] = ids
+    return df
+
+
+# ✅ REFRESH: adiciona version param pra quebrar cache
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=8)
+def load_treinos_from_github(version: str = "") -> pd.DataFrame:
+    local = _table_writer().local_df(version)
+    if local is not None:
+        return local.copy()
+    df = _storage().load_table("treinos")
+    if df.empty:
         return pd.DataFrame(columns=TREINOS_COLUMNS)
 
     for col in TREINOS_COLUMNS:
@@ -272,49 +1537,76 @@ def load_treinos_from_github(version: int = 0) -> pd.DataFrame:
     df["series_reps"] = df["series_reps"].astype(str)
     df["gif_key"] = df["gif_key"].astype(str)
     df["alt_group"] = df["alt_group"].astype(str)
-    return df
+    return _treino_row_ids(df)
 
 
-def save_treinos_to_github(df_all: pd.DataFrame) -> bool:
+def _normalize_treinos(df_all: pd.DataFrame) -> pd.DataFrame:
     for col in TREINOS_COLUMNS:
         if col not in df_all.columns:
             df_all[col] = ""
     df_all = df_all[TREINOS_COLUMNS].copy()
     df_all["ordem"] = pd.to_numeric(df_all["ordem"], errors="coerce").fillna(9999).astype(int)
-    df_all = _clean_nans(df_all)
+    return _treino_row_ids(_clean_nans(df_all))
 
-    csv_txt = df_all.to_csv(index=False, encoding="utf-8")
-    ok = gh_write_file(GITHUB_TREINOS_PATH, csv_txt, f"update treinos {_now_utc_z()}")
-    if ok:
-        # ✅ REFRESH: limpa cache + incrementa versão
-        load_treinos_from_github.clear()
-        st.session_state.v_treinos += 1
-    return ok
-
-
-def _ensure_days_for_user(df_all: pd.DataFrame, user: str) -> pd.DataFrame:
-    """Garante que existam registros (mesmo vazios) para Seg–Sex no treinos.csv daquele user."""
-    df_all = df_all.copy()
-    dfu = df_all[df_all["user"].astype(str) == str(user)]
-    existing_days = set(dfu["dia"].astype(str).unique().tolist())
-
-    rows = []
-    for d in EDIT_DAYS:
-        if d not in existing_days:
-            rows.append({
-                "user": user,
-                "dia": d,
-                "ordem": 1,
-                "grupo": "",
-                "exercicio": "",
-                "series_reps": "",
-                "gif_key": "",
-                "alt_group": "",
-            })
 
-    if rows:
-        df_all = pd.concat([df_all, pd.DataFrame(rows)], ignore_index=True)
+def save_treinos_to_github(df_all: pd.DataFrame) -> bool:
+    """
+    Otimista: a tela já enxerga df_all no próximo rerun; o commit vai em segundo plano
+    (_TableWriter). Se falhar, a alteração é desfeita e aparece um aviso.
+    """
+    df_all = _normalize_treinos(df_all)
+    _table_writer().submit("treinos", df_all, f"update treinos {_now_utc_z()}")
+    return True
 
+
+class _TreinosIndex:
+    """
+    Índice em memória de uma versão de treinos.csv: (user, dia) -> rótulos das
+    linhas em ordem e row_id -> rótulo. Os rótulos valem para qualquer cópia de
+    load_treinos_from_github(versão), então a tela acha, edita e remove uma linha
+    sem varrer (nem reconverter) o plano de todos os usuários.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.by_id = dict(zip(df["row_id"], df.index))
+        ordered = df.sort_values("ordem", kind="stable")
+        groups = ordered.groupby([ordered["user"].astype(str), ordered["dia"].astype(str)], sort=False).indices
+        self.by_day = {key: ordered.index[pos].tolist() for key, pos in groups.items()}
+        self.days: dict = {}
+        for user, dia in self.by_day:
+            self.days.setdefault(user, set()).add(dia)
+
+    def day(self, user: str, dia: str) -> pd.DataFrame:
+        """Linhas do dia, por ordem (só o dia é copiado)."""
+        return self.df.loc[self.by_day.get((str(user), str(dia)), [])]
+
+    def missing_days(self, user: str) -> list[str]:
+        have = self.days.get(str(user), set())
+        return [d for d in EDIT_DAYS if d not in have]
+
+
+@st.cache_resource(max_entries=4)
+def load_treinos_index(v_treinos: str = "") -> _TreinosIndex:
+    """Índice por versão (não mexer no df dele: é compartilhado entre sessões)."""
+    return _TreinosIndex(load_treinos_from_github(v_treinos))
+
+
+def _ensure_days_for_user(df_all: pd.DataFrame, user: str, missing: list[str]) -> pd.DataFrame:
+    """Cria registros vazios para os dias (de Seg–Sex) que faltam no treinos.csv daquele user."""
+    rows = [{
+        "user": user,
+        "dia": d,
+        "ordem": 1,
+        "grupo": "",
+        "exercicio": "",
+        "series_reps": "",
+        "gif_key": "",
+        "alt_group": "",
+        "row_id": _new_row_id(),
+    } for d in missing]
+    if rows:
+        df_all = pd.concat([df_all, pd.DataFrame(rows, columns=TREINOS_COLUMNS)], ignore_index=True)
     return _clean_nans(df_all)
 
 
@@ -326,16 +1618,13 @@ EX_COLUMNS = ["exercicio", "grupo", "gif_key", "gif_url", "alt_group", "observac
 
 
 # ✅ REFRESH: adiciona version param pra quebrar cache
-@st.cache_data(ttl=60)
-def load_exercicios_from_github(version: int = 0) -> pd.DataFrame:
-    _ = int(version or 0)
-    txt, _ = gh_read_file(GITHUB_EXERCICIOS_PATH)
-    if not (txt or "").strip():
-        return pd.DataFrame(columns=EX_COLUMNS)
-
-    try:
-        df = pd.read_csv(io.StringIO(txt))
-    except Exception:
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=8)
+def load_exercicios_from_github(version: str = "") -> pd.DataFrame:
+    local = _table_writer().local_df(version)
+    if local is not None:
+        return local.copy()
+    df = _storage().load_table("exercicios")
+    if df.empty:
         return pd.DataFrame(columns=EX_COLUMNS)
 
     for col in EX_COLUMNS:
@@ -349,7 +1638,7 @@ def load_exercicios_from_github(version: int = 0) -> pd.DataFrame:
     return df
 
 
-def save_exercicios_to_github(df_all: pd.DataFrame) -> bool:
+def _normalize_exercicios(df_all: pd.DataFrame) -> pd.DataFrame:
     for col in EX_COLUMNS:
         if col not in df_all.columns:
             df_all[col] = ""
@@ -358,40 +1647,27 @@ def save_exercicios_to_github(df_all: pd.DataFrame) -> bool:
     df_all = _clean_nans(df_all)
     for c in EX_COLUMNS:
         df_all[c] = df_all[c].astype(str)
-
-    csv_txt = df_all.to_csv(index=False, encoding="utf-8")
-    ok = gh_write_file(GITHUB_EXERCICIOS_PATH, csv_txt, f"update exercicios {_now_utc_z()}")
-    if ok:
-        # ✅ REFRESH: limpa cache + incrementa versão
-        load_exercicios_from_github.clear()
-        st.session_state.v_exercicios += 1
-    return ok
+    return df_all
 
 
-def _thumb_from_url(url: str) -> str:
-    return (url or "").strip()
+def save_exercicios_to_github(df_all: pd.DataFrame) -> bool:
+    """Otimista, como save_treinos_to_github."""
+    df_all = _normalize_exercicios(df_all)
+    _table_writer().submit("exercicios", df_all, f"update exercicios {_now_utc_z()}")
+    return True
 
 
 def _exercise_lookup(df_ex: pd.DataFrame) -> dict:
     """
     index por nome (lower) => row dict
     """
-    m = {}
     if df_ex is None or df_ex.empty:
-        return m
-    for _, r in df_ex.iterrows():
-        name = str(r.get("exercicio", "") or "").strip()
-        if not name:
-            continue
-        m[name.lower()] = {
-            "exercicio": name,
-            "grupo": str(r.get("grupo", "") or "").strip(),
-            "gif_key": str(r.get("gif_key", "") or "").strip(),
-            "gif_url": str(r.get("gif_url", "") or "").strip(),
-            "alt_group": str(r.get("alt_group", "") or "").strip(),
-            "observacoes": str(r.get("observacoes", "") or "").strip(),
-        }
-    return m
+        return {}
+    df = pd.DataFrame({c: df_ex[c].fillna("").astype(str).str.strip() if c in df_ex.columns else "" for c in EX_COLUMNS})
+    df = df[df["exercicio"] != ""]
+    # nomes repetidos: vale o último (mesmo comportamento do dict montado linha a linha)
+    keys = df["exercicio"].str.lower()
+    return dict(zip(keys, df.to_dict("records")))
 
 
 def _workouts_from_treinos_csv(df_treinos: pd.DataFrame, df_ex: pd.DataFrame, user: str) -> dict:
@@ -401,70 +1677,1198 @@ def _workouts_from_treinos_csv(df_treinos: pd.DataFrame, df_ex: pd.DataFrame, us
     - grupo/gif_url podem vir do exercicios.csv se estiverem vazios no treinos.csv.
     """
     workouts = {d: [] for d in EDIT_DAYS}
-    dfu = df_treinos[df_treinos["user"].astype(str) == str(user)].copy()
+    dfu = df_treinos[df_treinos["user"].astype(str) == str(user)]
     if dfu.empty:
         return workouts
 
+    cols = ["dia", "ordem", "grupo", "exercicio", "series_reps", "alt_group"]
+    dfu = pd.DataFrame({c: dfu[c].fillna("").astype(str).str.strip() for c in cols})
+    dfu = dfu[(dfu["exercicio"] != "") & dfu["dia"].isin(EDIT_DAYS)]
+    dfu["ordem"] = pd.to_numeric(dfu["ordem"], errors="coerce").fillna(9999).astype(int)
+    dfu["_key"] = dfu["exercicio"].str.lower()
+
     ex_map = _exercise_lookup(df_ex)
+    ref = pd.DataFrame.from_dict(ex_map, orient="index", columns=["grupo", "gif_url", "alt_group"])
+    ref = ref.add_prefix("ref_").rename_axis("_key").reset_index()
+
+    m = dfu.merge(ref, on="_key", how="left")
+    empty_to_na = lambda s: s.mask(s == "")  # noqa: E731
+    m["grupo"] = empty_to_na(m["grupo"]).combine_first(m["ref_grupo"]).fillna("")
+    m["alt_group"] = empty_to_na(m["alt_group"]).combine_first(m["ref_alt_group"]).fillna("")
+    m["gif_url"] = m["ref_gif_url"].fillna("")
+
+    m = m.sort_values(["dia", "ordem"], kind="stable")
+    out_cols = ["grupo", "exercicio", "series_reps", "gif_url", "alt_group"]
+    for d, dfd in m.groupby("dia", sort=False):
+        workouts[d] = dfd[out_cols].to_dict("records")
+    return workouts
 
-    for d in EDIT_DAYS:
-        dfd = dfu[dfu["dia"].astype(str) == str(d)].copy()
-        dfd["ordem"] = pd.to_numeric(dfd["ordem"], errors="coerce").fillna(9999).astype(int)
-        dfd = dfd.sort_values("ordem", ascending=True)
 
-        dfd = dfd[dfd["exercicio"].astype(str).str.strip() != ""].copy()
-        rows = []
-        for _, r in dfd.iterrows():
-            ex_name = str(r.get("exercicio", "") or "").strip()
-            planned = str(r.get("series_reps", "") or "").strip()
-            grupo = str(r.get("grupo", "") or "").strip()
-            gif_url = ""
-            alt_group = str(r.get("alt_group", "") or "").strip()
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=8)
+def load_exercise_lookup(v_exercicios: str = "") -> dict:
+    return _exercise_lookup(load_exercicios_from_github(v_exercicios))
 
-            ref = ex_map.get(ex_name.lower())
-            if ref:
-                if not grupo:
-                    grupo = ref.get("grupo", "") or ""
-                gif_url = ref.get("gif_url", "") or ""
-                if not alt_group:
-                    alt_group = ref.get("alt_group", "") or ""
-
-            rows.append({
-                "grupo": grupo,
-                "exercicio": ex_name,
-                "series_reps": planned,
-                "gif_url": gif_url,
-                "alt_group": alt_group,
-            })
-        workouts[d] = rows
 
-    return workouts
+EX_PAGE_SIZES = (20, 50, 100)
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=8)
+def load_exercise_library(v_exercicios: str = "") -> pd.DataFrame:
+    """Catálogo limpo e já ordenado (grupo, exercicio)."""
+    df = _clean_nans(load_exercicios_from_github(v_exercicios))
+    return df.sort_values(["grupo", "exercicio"], ascending=True, kind="stable").reset_index(drop=True)
+
+
+# busca: peso de cada campo no ranking (nome pesa mais que grupo)
+SEARCH_FIELDS = {"exercicio": 3.0, "alt_group": 2.0, "gif_key": 1.5, "grupo": 1.0}
+SEARCH_MIN_SIMILARITY = 0.5  # fração dos trigramas do termo que o token precisa ter
+SEARCH_FUZZY_MIN_LEN = 4  # termos mais curtos só casam por prefixo
+
+
+def _fold(text: str) -> str:
+    """minúsculas, sem acento, pontuação vira espaço: "Glúteo (Cabo)" -> "gluteo cabo"."""
+    text = unicodedata.normalize("NFKD", str(text or "")).lower()
+    text = "".join(ch if ch.isalnum() else " " for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.split())
+
+
+def _grams(token: str) -> set:
+    """trigramas com marcador de início ("$su", "sup", ...): base da busca aproximada."""
+    t = "$" + token
+    return {t[i:i + 3] for i in range(len(t) - 2)}
+
+
+class _SearchIndex:
+    """
+    Índice invertido do catálogo (tokens sem acento + trigramas), montado uma vez
+    por versão. search() devolve posições das linhas ranqueadas: todo termo da
+    busca precisa casar (exato > prefixo > trecho > parecido) em algum campo.
+    Com 10k exercícios, ~0,1–0,3 ms por busca (tests/test_search.py mede).
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        postings: dict = {}  # token -> {linha: peso do campo}
+        self.grams: dict = {}  # trigrama -> {tokens}
+        self.n = len(df)
+        for field, weight in SEARCH_FIELDS.items():
+            if field not in df.columns:
+                continue
+            for pos, text in enumerate(df[field].astype(str)):
+                for tok in _fold(text).split():
+                    docs = postings.setdefault(tok, {})
+                    if docs.get(pos, 0.0) < weight:
+                        docs[pos] = weight
+        # token -> (linhas, pesos) em arrays: a busca pontua o catálogo inteiro sem laço em Python
+        self.postings = {
+            tok: (np.fromiter(docs.keys(), np.int64, len(docs)), np.fromiter(docs.values(), np.float64, len(docs)))
+            for tok, docs in postings.items()
+        }
+        self.vocab = sorted(self.postings)
+        for tok in self.vocab:
+            for g in _grams(tok):
+                self.grams.setdefault(g, set()).add(tok)
+
+    def _matches(self, term: str) -> dict:
+        """{token do índice: qualidade 0..1} para um termo da busca."""
+        # prefixo: faixa contígua do vocabulário ordenado
+        out = {}
+        i = bisect.bisect_left(self.vocab, term)
+        while i < len(self.vocab) and self.vocab[i].startswith(term):
+            tok = self.vocab[i]
+            out[tok] = 1.0 if tok == term else 0.9
+            i += 1
+        if len(term) < SEARCH_FUZZY_MIN_LEN:
+            return out
+        # trecho / parecido: tokens que dividem trigramas com o termo
+        qg = _grams(term)
+        shared: dict = {}
+        for g in qg:
+            for tok in self.grams.get(g, ()):
+                shared[tok] = shared.get(tok, 0) + 1
+        for tok, n in shared.items():
+            if tok in out:
+                continue
+            if term in tok:
+                out[tok] = 0.7
+            elif n / len(qg) >= SEARCH_MIN_SIMILARITY:
+                out[tok] = 0.5 * n / len(qg)
+        return out
+
+    def search(self, query: str, limit: int | None = None) -> list[int]:
+        scores = None  # pontuação por linha (0 = não casou todos os termos até aqui)
+        for term in _fold(query).split():
+            matches = self._matches(term)
+            if not matches:
+                return []
+            pos = np.concatenate([self.postings[tok][0] for tok in matches])
+            sc = np.concatenate([self.postings[tok][1] * quality for tok, quality in matches.items()])
+            term_scores = np.zeros(self.n)
+            np.maximum.at(term_scores, pos, sc)  # melhor token do termo em cada linha
+            scores = term_scores if scores is None else np.where((scores > 0) & (term_scores > 0), scores + term_scores, 0.0)
+        if scores is None:
+            return []
+        hits = np.flatnonzero(scores)
+        # empate: mantém a ordem do catálogo (grupo, exercicio)
+        ranked = hits[np.argsort(-scores[hits], kind="stable")]
+        return (ranked[:limit] if limit else ranked).tolist()
+
+
+@st.cache_resource(max_entries=4)
+def load_exercise_search(v_exercicios: str = "") -> _SearchIndex:
+    """Índice de busca por versão do catálogo (posições = linhas de load_exercise_library)."""
+    return _SearchIndex(load_exercise_library(v_exercicios))
+
+
+def search_exercise_names(v_exercicios: str, q: str) -> list[str]:
+    """Nomes do catálogo que casam com q, do mais relevante para o menos."""
+    df = load_exercise_library(v_exercicios)
+    pos = load_exercise_search(v_exercicios).search(q)
+    return df["exercicio"].astype(str).iloc[pos].tolist()
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=64)
+def query_exercise_library(v_exercicios: str, q: str, grupo: str, page: int, page_size: int) -> tuple[pd.DataFrame, int]:
+    """
+    Uma página do catálogo filtrado: (linhas da página, total filtrado).
+    Com busca, a ordem é a do ranking do índice; sem busca, (grupo, exercicio).
+    Filtro e ordenação ficam aqui (memoizados); a tela só desenha page_size linhas.
+    """
+    df = load_exercise_library(v_exercicios)
+    hits = df.iloc[load_exercise_search(v_exercicios).search(q)] if _fold(q) else df
+    if grupo:
+        hits = hits[hits["grupo"].astype(str) == grupo]
+    start = max(page, 0) * page_size
+    return hits.iloc[start:start + page_size], len(hits)
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=8)
+def load_workouts(v_treinos: str, v_exercicios: str, user: str) -> dict:
+    """_workouts_from_treinos_csv memoizado por (versões, user): reruns sem salvar não recalculam nada."""
+    return _workouts_from_treinos_csv(load_treinos_from_github(v_treinos), load_exercicios_from_github(v_exercicios), user)
+
+
+# ============================================================
+# 4) Storage plugável (GitHub CSV ou SQLite local)
+# ============================================================
+# st.secrets:
+#   [storage]
+#   backend = "github"          # ou "sqlite"
+#   sqlite_path = "Data/treino.sqlite3"
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Data")
+STORAGE_TABLES = ("treinos", "exercicios", "log")
+
+
+def _table_columns(table: str) -> list[str]:
+    return {"treinos": TREINOS_COLUMNS, "exercicios": EX_COLUMNS, "log": LOG_COLUMNS, "log_raw": LOG_COLUMNS}[table]
+
+
+class GitHubStorage:
+    """CSV no repo via GitHub Contents API (comportamento original)."""
+
+    name = "github"
+
+    def _path(self, table: str) -> str:
+        return {"treinos": GITHUB_TREINOS_PATH, "exercicios": GITHUB_EXERCICIOS_PATH}[table]
+
+    def load_table(self, table: str, columns: list[str] | None = None) -> pd.DataFrame:
+        if table == "log":
+            return _load_log_github(columns)
+        cols = _table_columns(table)
+        df = _gh_read_csv(self._path(table), lambda txt: _parse_csv(txt, cols))
+        return df[[c for c in columns if c in df.columns]] if columns else df
+
+    def save_table(self, table: str, df: pd.DataFrame, message: str, base_version: str | None = None) -> tuple[bool, str]:
+        """base_version (sha): só grava se a tabela ainda estiver nessa versão; senão, "Conflito: ..."."""
+        csv_txt = df.to_csv(index=False, encoding="utf-8")
+        return gh_put_file(self._path(table), csv_txt, message, base_version)
+
+    def append_log(self, df_new: pd.DataFrame) -> tuple[bool, str]:
+        return _append_log_github(df_new)
+
+    def save_tables(self, tables: dict, message: str, base_versions: dict | None = None) -> tuple[bool, str]:
+        """Tabelas inteiras num único commit (base_versions: como no save_table, por tabela)."""
+        files = {self._path(t): df.to_csv(index=False, encoding="utf-8") for t, df in tables.items()}
+        bases = {self._path(t): v for t, v in (base_versions or {}).items()}
+        return gh_commit_files(files, message, base_shas=bases)
+
+    def table_version(self, table: str, refresh: bool = True) -> str:
+        """
+        Versão global = sha do blob (log: hash das marcas de todos os CSVs).
+        refresh=False usa o sha já conhecido (ex.: logo depois do nosso PUT), sem rede.
+        """
+        if table == "log":
+            return hashlib.sha1(json.dumps(sorted(self.log_marks().items())).encode("utf-8")).hexdigest()
+        path = self._path(table)
+        if refresh or path not in _sha_cache():
+            _gh_file_meta(path)
+        return _sha_cache().get(path, "")
+
+    def load_rollups(self) -> pd.DataFrame | None:
+        return None  # calculados em memória (load_rollups / _IncrementalLog.rollups)
+
+    def compact_sessions(self) -> tuple[bool, str]:
+        return compact_log_sessions()
+
+    def rebuild_rollups(self) -> tuple[bool, str]:
+        """Rollups ficam em memória; só apaga o rollups.parquet de versões anteriores."""
+        if _gh_file_meta(GITHUB_LOG_ROLLUP_PATH) is None:
+            return True, "rollups calculados em memória (nada no repo)"
+        return gh_commit_files({GITHUB_LOG_ROLLUP_PATH: None}, f"remove treino log rollups {_now_utc_z()}")
+
+    def log_marks(self) -> dict:
+        """{path: (sha, bytes)} de cada CSV do log (GETs condicionais: 304 se nada mudou)."""
+        listing = gh_list_dir(GITHUB_LOG_DIR) if _log_mode() == "segments" else []
+        return {f["path"]: (f["sha"], f["size"]) for f in _log_source_files(listing)}
+
+    def load_log_delta(self, old: dict, new: dict, columns: list[str] | None = None) -> pd.DataFrame | None:
+        """
+        Linhas dos CSVs que mudaram entre as marcas old e new. Só baixa os arquivos
+        alterados e só parseia os bytes depois do offset antigo, conferindo pelo sha
+        que o começo do arquivo é o mesmo. None se algum arquivo foi reescrito/removido.
+        """
+        if set(old) - set(new):
+            return None
+        frames = []
+        for path, (sha, size) in new.items():
+            if old.get(path) == (sha, size):
+                continue
+            data, _ = gh_read_bytes(path)
+            if path not in old:
+                frames.append(_parse_log_csv(data.decode("utf-8", errors="replace")))
+                continue
+            old_sha, old_size = old[path]
+            if len(data) < old_size or _git_blob_sha(data[:old_size]) != old_sha:
+                return None
+            frames.append(_parse_log_csv(_log_csv_tail(data, old_size)))
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=LOG_COLUMNS)
+        return df[columns] if columns else df
+
+
+class SQLiteStorage:
+    """
+    SQLite local: tabelas indexadas, append do log é um INSERT (ms) e não
+    consome o rate limit da API do GitHub. Uma conexão por processo, serializada por lock.
+    """
+
+    name = "sqlite"
+
+    # PRAGMA user_version: 2 = log v2 (series_reps_planejado); 3 = treinos.row_id
+    _VERSION = 3
+    _ADDED_COLUMNS = {
+        2: [("log", "series_reps_planejado"), ("log_raw", "series_reps_planejado")],
+        3: [("treinos", "row_id")],
+    }
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS treinos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user TEXT NOT NULL DEFAULT '', dia TEXT NOT NULL DEFAULT '', ordem INTEGER NOT NULL DEFAULT 9999,
+        grupo TEXT DEFAULT '', exercicio TEXT DEFAULT '', series_reps TEXT DEFAULT '',
+        gif_key TEXT DEFAULT '', alt_group TEXT DEFAULT '', row_id TEXT DEFAULT ''
+    );
+    CREATE INDEX IF NOT EXISTS ix_treinos_user_dia ON treinos (user, dia, ordem);
+
+    CREATE TABLE IF NOT EXISTS exercicios (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        exercicio TEXT NOT NULL DEFAULT '', grupo TEXT DEFAULT '', gif_key TEXT DEFAULT '',
+        gif_url TEXT DEFAULT '', alt_group TEXT DEFAULT '', observacoes TEXT DEFAULT ''
+    );
+    CREATE INDEX IF NOT EXISTS ix_exercicios_nome ON exercicios (exercicio COLLATE NOCASE);
+
+    CREATE TABLE IF NOT EXISTS log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT NOT NULL DEFAULT '', user TEXT DEFAULT '', dia TEXT DEFAULT '',
+        grupo TEXT DEFAULT '', exercicio TEXT DEFAULT '', series_reps TEXT DEFAULT '',
+        series_reps_planejado TEXT DEFAULT '', peso_kg REAL DEFAULT 0, feito INTEGER DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS ix_log_user_dia_ex ON log (user, dia, exercicio, timestamp);
+    CREATE INDEX IF NOT EXISTS ix_log_timestamp ON log (timestamp);
+
+    CREATE TABLE IF NOT EXISTS log_rollup (
+        user TEXT NOT NULL, exercicio TEXT NOT NULL, dia TEXT NOT NULL, periodo TEXT NOT NULL, inicio TEXT NOT NULL,
+        peso_max REAL DEFAULT 0, volume REAL DEFAULT 0, sessoes INTEGER DEFAULT 0, feitos INTEGER DEFAULT 0,
+        primeiro_dia TEXT DEFAULT '', ultimo_dia TEXT DEFAULT '', peso_max_ant REAL DEFAULT 0,
+        ultimo_peso REAL DEFAULT 0, ultimo_volume REAL DEFAULT 0, ultimo_feito INTEGER DEFAULT 0,
+        PRIMARY KEY (user, exercicio, dia, periodo, inicio)
+    );
+    CREATE INDEX IF NOT EXISTS ix_log_rollup_inicio ON log_rollup (inicio);
+
+    CREATE TABLE IF NOT EXISTS log_raw (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT NOT NULL DEFAULT '', user TEXT DEFAULT '', dia TEXT DEFAULT '',
+        grupo TEXT DEFAULT '', exercicio TEXT DEFAULT '', series_reps TEXT DEFAULT '',
+        series_reps_planejado TEXT DEFAULT '', peso_kg REAL DEFAULT 0, feito INTEGER DEFAULT 0
+    );
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        new_db = not os.path.exists(path)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(self._SCHEMA)
+        self._migrate_schema()
+        if new_db and os.path.isdir(DATA_DIR):
+            # primeira execução: importa os CSVs do repo (migração)
+            self.import_csv(DATA_DIR)
+        elif self._rollup_missing():
+            self.rebuild_rollups()  # banco de antes dos rollups
+
+    def _migrate_schema(self):
+        """
+        Bancos antigos ganham as colunas novas (ALTER TABLE). treinos.row_id começa
+        vazio: load_treinos_from_github dá ids determinísticos e o próximo save grava.
+        """
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= self._VERSION:
+            return
+        with self.conn:
+            for step in range(version + 1, self._VERSION + 1):
+                for table, col in self._ADDED_COLUMNS.get(step, []):
+                    have = {r[1] for r in self.conn.execute(f"PRAGMA table_info({table})")}
+                    if col not in have:
+                        self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {col} TEXT DEFAULT ''")
+            self.conn.execute(f"PRAGMA user_version = {self._VERSION}")
+
+    def load_table(self, table: str, columns: list[str] | None = None) -> pd.DataFrame:
+        cols = [c for c in _table_columns(table) if not columns or c in columns]
+        order = {"treinos": "id", "exercicios": "id", "log": "timestamp, id"}[table]
+        sql = f"SELECT {', '.join(cols)} FROM {table} ORDER BY {order}"
+        with self.lock:
+            df = pd.read_sql_query(sql, self.conn)
+        if table == "log":
+            df.attrs["log_schema"] = LOG_SCHEMA_VERSION  # colunas NOT NULL/DEFAULT: já canônico
+        return df
+
+    def _insert(self, table: str, df: pd.DataFrame):
+        cols = _table_columns(table)
+        rows = df[cols].itertuples(index=False, name=None)
+        sql = f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+        self.conn.executemany(sql, rows)
+
+    def save_table(self, table: str, df: pd.DataFrame, message: str = "", base_version: str | None = None) -> tuple[bool, str]:
+        try:
+            with self.lock, self.conn:
+                if base_version is not None and self._version(table) != base_version:
+                    return False, f"{GH_CONFLICT}: {table} foi alterada por outra sessão"
+                self.conn.execute(f"DELETE FROM {table}")
+                self._insert(table, df)
+        except sqlite3.Error as e:
+            return False, f"Erro SQLite: {e}"
+        return True, ""
+
+    def append_log(self, df_new: pd.DataFrame) -> tuple[bool, str]:
+        try:
+            with self.lock, self.conn:
+                self._insert("log", df_new)
+                self._update_rollup(df_new)
+        except sqlite3.Error as e:
+            return False, f"Erro SQLite: {e}"
+        return True, ""
+
+    def save_tables(self, tables: dict, message: str = "", base_versions: dict | None = None) -> tuple[bool, str]:
+        try:
+            with self.lock, self.conn:
+                for table, base_version in (base_versions or {}).items():
+                    if self._version(table) != base_version:
+                        return False, f"{GH_CONFLICT}: {table} foi alterada por outra sessão"
+                for table, df in tables.items():
+                    self.conn.execute(f"DELETE FROM {table}")
+                    self._insert(table, df)
+                if "log" in tables:
+                    self._write_rollup(_rollup_rows(self.load_log_unlocked()), since="")
+        except sqlite3.Error as e:
+            return False, f"Erro SQLite: {e}"
+        return True, ""
+
+    def load_log_unlocked(self) -> pd.DataFrame:
+        return pd.read_sql_query(f"SELECT {', '.join(LOG_COLUMNS)} FROM log ORDER BY timestamp, id", self.conn)
+
+    def _write_rollup(self, df: pd.DataFrame, since: str):
+        """Substitui as linhas do rollup com inicio >= since ("" = todas)."""
+        self.conn.execute("DELETE FROM log_rollup WHERE inicio >= ?", (since,))
+        rows = _rollup_types(df).itertuples(index=False, name=None)
+        sql = f"INSERT INTO log_rollup ({', '.join(ROLLUP_COLUMNS)}) VALUES ({', '.join('?' * len(ROLLUP_COLUMNS))})"
+        self.conn.executemany(sql, rows)
+
+    def _update_rollup(self, df_new: pd.DataFrame):
+        # só os períodos a partir do mais antigo das linhas novas mudam: o resto nem é lido
+        new = _rollup_rows(df_new)
+        if new.empty:
+            return
+        since = new["inicio"].min()
+        old = pd.read_sql_query("SELECT * FROM log_rollup WHERE inicio >= ?", self.conn, params=(since,))
+        self._write_rollup(_update_rollups(_rollup_types(old), df_new, self._log_since), since)
+
+    def _log_since(self, day: str) -> pd.DataFrame:
+        sql = f"SELECT {', '.join(LOG_COLUMNS)} FROM log WHERE timestamp >= ? ORDER BY timestamp, id"
+        return pd.read_sql_query(sql, self.conn, params=(day,))
+
+    def _rollup_missing(self) -> bool:
+        with self.lock:
+            has_log = self.conn.execute("SELECT EXISTS (SELECT 1 FROM log)").fetchone()[0]
+            has_rollup = self.conn.execute("SELECT EXISTS (SELECT 1 FROM log_rollup)").fetchone()[0]
+        return bool(has_log) and not has_rollup
+
+    def load_rollups(self) -> pd.DataFrame | None:
+        with self.lock:
+            return _rollup_types(pd.read_sql_query("SELECT * FROM log_rollup", self.conn))
+
+    def compact_sessions(self) -> tuple[bool, str]:
+        """Log canônico (ver _session_final_mask); os eventos que saem vão para log_raw."""
+        try:
+            with self.lock, self.conn:
+                df = pd.read_sql_query(f"SELECT id, {', '.join(LOG_COLUMNS)} FROM log", self.conn)
+                drop = df[~_session_final_mask(df)]
+                if drop.empty:
+                    return True, "0 eventos arquivados"
+                self._insert("log_raw", drop)
+                self.conn.executemany("DELETE FROM log WHERE id = ?", ((int(i),) for i in drop["id"]))
+                self._write_rollup(_rollup_rows(self.load_log_unlocked()), since="")
+        except sqlite3.Error as e:
+            return False, f"Erro SQLite: {e}"
+        return True, f"{len(drop)} eventos arquivados"
+
+    def rebuild_rollups(self) -> tuple[bool, str]:
+        try:
+            with self.lock, self.conn:
+                self._write_rollup(_rollup_rows(self.load_log_unlocked()), since="")
+        except sqlite3.Error as e:
+            return False, f"Erro SQLite: {e}"
+        return True, ""
+
+    def _version(self, table: str) -> str:
+        # save_table apaga e reinsere (AUTOINCREMENT): qualquer escrita muda (maior id, nº de linhas)
+        max_id, n = self.conn.execute(f"SELECT COALESCE(MAX(id), 0), COUNT(*) FROM {table}").fetchone()
+        return f"{max_id}:{n}"
+
+    def table_version(self, table: str, refresh: bool = True) -> str:
+        with self.lock:
+            return self._version(table)
+
+    def log_marks(self) -> dict:
+        """{"log": (maior id, nº de linhas)}: basta para saber se só houve INSERTs."""
+        with self.lock:
+            max_id, n = self.conn.execute("SELECT COALESCE(MAX(id), 0), COUNT(*) FROM log").fetchone()
+        return {"log": (int(max_id), int(n))}
+
+    def load_log_delta(self, old: dict, new: dict, columns: list[str] | None = None) -> pd.DataFrame | None:
+        last_id, n_old = old.get("log", (0, 0))
+        cols = [c for c in LOG_COLUMNS if not columns or c in columns]
+        sql = f"SELECT {', '.join(cols)} FROM log WHERE id > ? ORDER BY timestamp, id"
+        with self.lock:
+            df = pd.read_sql_query(sql, self.conn, params=(last_id,))
+        df.attrs["log_schema"] = LOG_SCHEMA_VERSION
+        # save_table("log") apaga e reinsere (ids novos): aí o delta não bate com a contagem
+        if n_old + len(df) != new.get("log", (0, 0))[1]:
+            return None
+        return df
+
+    def import_csv(self, data_dir: str) -> dict:
+        """Importa treinos.csv, exercicios.csv e o log (arquivo único + Data/log/*.csv). Substitui o conteúdo."""
+        tables = {}
+        for table, fname in (("treinos", "treinos.csv"), ("exercicios", "exercicios.csv")):
+            fpath = os.path.join(data_dir, fname)
+            if not os.path.exists(fpath):
+                continue
+            with open(fpath, "r", encoding="utf-8") as f:
+                df = _parse_csv(f.read(), _table_columns(table))
+            for col in _table_columns(table):
+                if col not in df.columns:
+                    df[col] = ""
+            df = _clean_nans(df[_table_columns(table)])
+            if table == "treinos":
+                df["ordem"] = pd.to_numeric(df["ordem"], errors="coerce").fillna(9999).astype(int)
+                df = _treino_row_ids(df)
+            tables[table] = df
+
+        # o Treino_log.csv legado (outro schema) entra junto; em disco sem distinção de
+        # maiúsculas ele é o mesmo arquivo que treino_log.csv, então só conta uma vez
+        log_files = [os.path.join(data_dir, os.path.basename(GITHUB_LOG_PATH))]
+        legacy = os.path.join(data_dir, os.path.basename(GITHUB_LOG_LEGACY_PATH))
+        if os.path.exists(legacy) and not (os.path.exists(log_files[0]) and os.path.samefile(legacy, log_files[0])):
+            log_files.append(legacy)
+        seg_dir = os.path.join(data_dir, os.path.basename(GITHUB_LOG_DIR))
+        if os.path.isdir(seg_dir):
+            log_files += sorted(
+                os.path.join(seg_dir, n) for n in os.listdir(seg_dir) if re.fullmatch(r"\d{4}-\d{2}\.csv", n)
+            )
+        frames = []
+        for fpath in log_files:
+            if os.path.exists(fpath):
+                with open(fpath, "r", encoding="utf-8") as f:
+                    frames.append(_parse_log_csv(f.read()))
+        if frames:
+            tables["log"] = _normalize_log_rows(pd.concat(frames, ignore_index=True))
+
+        # tudo numa transação: uma importação interrompida não deixa o banco pela metade
+        ok, err = self.save_tables(tables)
+        if not ok:
+            raise sqlite3.Error(err)
+        return {table: len(df) for table, df in tables.items()}
+
+    def export_csv(self, data_dir: str) -> dict:
+        """Exporta as três tabelas no formato dos CSVs do repo (log vai para o arquivo único)."""
+        os.makedirs(data_dir, exist_ok=True)
+        counts = {}
+        for table, fname in (
+            ("treinos", "treinos.csv"),
+            ("exercicios", "exercicios.csv"),
+            ("log", os.path.basename(GITHUB_LOG_PATH)),
+        ):
+            df = self.load_table(table)
+            df.to_csv(os.path.join(data_dir, fname), index=False, encoding="utf-8")
+            counts[table] = len(df)
+        return counts
+
+
+@st.cache_resource
+def _storage_for(backend: str, sqlite_path: str):
+    if backend == "sqlite":
+        return SQLiteStorage(sqlite_path)
+    return GitHubStorage()
+
+
+def _storage():
+    cfg = st.secrets.get("storage", {})
+    backend = str(cfg.get("backend", "github") or "github").strip().lower()
+    sqlite_path = str(cfg.get("sqlite_path", "") or os.path.join(DATA_DIR, "treino.sqlite3"))
+    return _storage_for(backend, sqlite_path)
+
+
+# ============================================================
+# 5) Versões globais (cache compartilhado entre sessões)
+# ============================================================
+class _DataVersions:
+    """
+    Versão atual de cada tabela (sha do blob), uma só para o processo: todas as sessões
+    usam a mesma chave nos caches, e quem salva publica a versão nova na hora (bump).
+    Mudanças de fora do processo (outro servidor, commit manual) aparecem pela checagem
+    barata (GET condicional / COUNT) feita no máximo a cada CACHE_TTL_SECONDS.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.keys: dict[str, str] = {}
+        self.checked: dict[str, float] = {}
+
+    def get(self, table: str, storage) -> str:
+        with self.lock:
+            if table in self.keys and time.time() - self.checked.get(table, 0.0) < CACHE_TTL_SECONDS:
+                return self.keys[table]
+        return self.publish(table, storage.table_version(table))
+
+    def publish(self, table: str, key: str) -> str:
+        with self.lock:
+            self.keys[table] = key
+            self.checked[table] = time.time()
+        return key
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return dict(self.keys)
+
+
+@st.cache_resource
+def _data_versions() -> _DataVersions:
+    return _DataVersions()
+
+
+def data_version(table: str, subscribe: bool = True) -> str:
+    """
+    Chave de cache global da tabela. Com subscribe, a sessão passa a ser avisada
+    (rerun pelo _version_watcher) quando outra sessão/device gravar essa tabela.
+    Com gravação otimista pendente, a chave é "local:N" (o DataFrame ainda em memória).
+    """
+    key = _table_writer().local_key(table) or _data_versions().get(table, _storage())
+    if subscribe:
+        st.session_state.seen_versions[table] = key
+    return key
+
+
+def _bump_version(table: str):
+    """Depois de gravar: publica a versão nova para todas as sessões (seguro fora da thread do Streamlit)."""
+    storage = _storage()
+    _data_versions().publish(table, storage.table_version(table, refresh=False))
+
+
+def _warm(table: str, storage, full_history: bool):
+    key = _data_versions().get(table, storage)
+    if table == "treinos":
+        load_treinos_from_github(key)
+    elif table == "exercicios":
+        load_exercicios_from_github(key)
+        load_exercise_lookup(key)
+    else:
+        load_last_index(key)
+        if full_history:
+            load_history_from_github(key)
+
+
+def prefetch_data(full_history: bool = False):
+    """
+    Baixa as três tabelas em paralelo (uma thread por arquivo) e aquece os caches:
+    a tela que vem depois só faz cache hits. O custo vira o do request mais lento.
+    Os workers herdam o ScriptRunContext de quem chamou (loaders cacheados precisam dele).
+    """
+    storage = _storage()
+    ctx = get_script_run_ctx()
+    attach = (lambda: add_script_run_ctx(threading.current_thread(), ctx)) if ctx else None
+    with ThreadPoolExecutor(max_workers=len(STORAGE_TABLES), thread_name_prefix="prefetch", initializer=attach) as pool:
+        futures = [pool.submit(_warm, t, storage, full_history) for t in STORAGE_TABLES]
+    for f in futures:
+        f.result()
+
+
+def _prefetch_in_background():
+    """Depois do login: aquece tudo sem bloquear a tela (uma vez por sessão)."""
+    if st.session_state.get("prefetched"):
+        return
+    st.session_state.prefetched = True
+
+    def _run():
+        try:
+            prefetch_data(full_history=True)
+        except Exception:
+            pass  # a tela carrega normalmente se o aquecimento falhar
+
+    thread = threading.Thread(target=_run, name="prefetch", daemon=True)
+    add_script_run_ctx(thread, get_script_run_ctx())
+    thread.start()
+
+
+def _prefetch_on_change():
+    """prefetch_data só quando alguma versão mudou desde o último aquecimento desta sessão (não a cada rerun)."""
+    if st.session_state.get("prefetched_versions") == _data_versions().snapshot():
+        return
+    prefetch_data()
+    st.session_state.prefetched_versions = _data_versions().snapshot()
+
+
+# chave de linha para o merge de três vias (treinos: row_id; exercicios: nome sem maiúsculas)
+MERGE_KEYS = {"treinos": ["row_id"], "exercicios": ["exercicio"]}
+
+
+def _normalize_table(table: str, df: pd.DataFrame) -> pd.DataFrame:
+    return _normalize_treinos(df) if table == "treinos" else _normalize_exercicios(df)
+
+
+def _load_table_df(table: str, key: str) -> pd.DataFrame:
+    return load_treinos_from_github(key) if table == "treinos" else load_exercicios_from_github(key)
+
+
+def _row_keys(table: str, df: pd.DataFrame) -> list[tuple]:
+    parts = [df[c].astype(str).str.strip() for c in MERGE_KEYS[table]]
+    if table == "exercicios":
+        parts = [p.str.lower() for p in parts]
+    return list(zip(*parts))
+
+
+def _merge_rows(table: str, base: pd.DataFrame, local: pd.DataFrame, remote: pd.DataFrame) -> pd.DataFrame:
+    """
+    Merge de três vias por linha: aplica em remote o que mudou de base para local.
+    Linha removida em local sai de remote; linha alterada em local substitui a de
+    mesma chave em remote no mesmo lugar; linha nova entra no fim (na ordem de local).
+    O resto de remote (edições do outro device) fica, na ordem de remote: o CSV não
+    muda de ordem só porque uma linha foi editada.
+    """
+    cols = _table_columns(table)
+    sig = lambda df: list(zip(*[df[c].astype(str) for c in cols]))  # noqa: E731
+
+    kb, kl, kr = _row_keys(table, base), _row_keys(table, local), _row_keys(table, remote)
+    base_rows = dict(zip(kb, sig(base)))
+    changed: dict = {}  # chave -> posições em local das linhas novas/alteradas
+    for pos, (k, row) in enumerate(zip(kl, sig(local))):
+        if base_rows.get(k) != row:
+            changed.setdefault(k, []).append(pos)
+    removed = set(kb) - set(kl)
+
+    # posições em [remote; local]: remote p -> p, local q -> len(remote) + q
+    order, placed = [], set()
+    for pos, k in enumerate(kr):
+        if k in changed:
+            if k not in placed:
+                order += [len(remote) + q for q in changed[k]]
+                placed.add(k)
+        elif k not in removed:
+            order.append(pos)
+    for k, positions in changed.items():
+        if k not in placed:
+            order += [len(remote) + q for q in positions]
+
+    both = pd.concat([remote[cols], local[cols]], ignore_index=True)
+    return _normalize_table(table, both.iloc[order].reset_index(drop=True))
+
+
+class _TableWriter:
+    """
+    Gravação otimista de treinos/exercicios. submit() guarda o DataFrame novo como
+    versão "local:N" (as telas já leem dele) e um worker faz o commit em segundo plano;
+    edições seguidas da mesma tabela viram um commit só (vale a última), e tabelas
+    pendentes ao mesmo tempo (ex.: treinos + exercicios) vão juntas no mesmo commit.
+    Antes de gravar, confere se a tabela no storage ainda é a versão em que a edição
+    se baseou; se outra pessoa gravou antes, faz merge por linha (_merge_rows) e grava
+    condicionado à versão lida (conflito de novo = relê e refaz, com backoff). Se o
+    commit falhar de vez, a versão local é descartada e fica um aviso (notices).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.seq = 0
+        # table -> {"seq", "df", "message", "base"}; fica aqui até o commit terminar
+        self.local: dict[str, dict] = {}
+        self.queued: set[str] = set()
+        self.notices: list[tuple[int, str]] = []
+        self.worker = threading.Thread(target=self._run, name="table-writer", daemon=True)
+        self.worker.start()
+
+    def submit(self, table: str, df: pd.DataFrame, message: str):
+        storage = _storage()
+        with self.lock:
+            prev = self.local.get(table)
+            base, base_df = (prev["base"], prev["base_df"]) if prev else (None, None)
+        if base is None:
+            base = _data_versions().get(table, storage)
+            base_df = _load_table_df(table, base)
+        with self.lock:
+            self.seq += 1
+            self.local[table] = {
+                "seq": self.seq, "df": df, "message": message,
+                "base": base, "base_df": base_df, "storage": storage,
+            }
+            self.queued.add(table)
+        self.wake.set()
+
+    def local_key(self, table: str) -> str:
+        with self.lock:
+            entry = self.local.get(table)
+            return f"local:{entry['seq']}" if entry else ""
+
+    def local_df(self, key: str) -> pd.DataFrame | None:
+        if not str(key).startswith("local:"):
+            return None
+        seq = int(key.split(":", 1)[1])
+        with self.lock:
+            for entry in self.local.values():
+                if entry["seq"] == seq:
+                    return entry["df"]
+        return None
+
+    def _commit(self, tables: list[str]):
+        """
+        Grava de uma vez todas as tabelas pendentes (storage.save_tables: um commit no
+        GitHub, uma transação no SQLite), cada uma condicionada à versão em que se baseou.
+        """
+        with self.lock:
+            self.queued.difference_update(tables)
+            entries = {t: self.local[t] for t in tables if t in self.local}
+        if not entries:
+            return
+        storage = next(iter(entries.values()))["storage"]
+
+        dfs, ok, err = {}, False, ""
+        try:
+            for attempt in range(MERGE_RETRIES):
+                dfs, bases = {}, {}
+                for table, entry in entries.items():
+                    current = storage.table_version(table)
+                    dfs[table] = entry["df"]
+                    if current != entry["base"]:
+                        # outro device gravou antes: reaplica nossas mudanças (por linha) sobre a versão dele
+                        remote = _normalize_table(table, storage.load_table(table))
+                        dfs[table] = _merge_rows(table, entry["base_df"], entry["df"], remote)
+                    bases[table] = current
+                message = next(iter(entries.values()))["message"] if len(entries) == 1 else (
+                    f"update {', '.join(entries)} {_now_utc_z()}"
+                )
+                ok, err = storage.save_tables(dfs, message, base_versions=bases)
+                if ok or not _is_conflict(err):
+                    break
+                _merge_backoff(attempt)
+        except Exception as e:
+            ok, err = False, f"{type(e).__name__}: {e}"
+
+        for table, entry in entries.items():
+            self._finish(table, entry, dfs.get(table), ok, err, storage)
+
+    def _finish(self, table: str, entry: dict, df, ok: bool, err: str, storage):
+        new_key = storage.table_version(table, refresh=False) if ok else ""
+        with self.lock:
+            latest = self.local.get(table)
+            if ok:
+                _data_versions().publish(table, new_key)
+                if latest is entry:
+                    del self.local[table]
+                elif latest is not None:
+                    # edição mais nova foi feita em cima desta: a base dela passa a ser o que o usuário
+                    # viu (entry["df"]); se houve merge, força o merge de novo na próxima gravação
+                    latest["base_df"] = entry["df"]
+                    latest["base"] = new_key if df is entry["df"] else ""
+            else:
+                # rollback: descarta a versão local (e as edições feitas em cima dela)
+                self.local.pop(table, None)
+                self.queued.discard(table)
+                self.seq += 1
+                self.notices.append((self.seq, f"Não consegui salvar {table} ({err}). A alteração foi desfeita."))
+                self.notices = self.notices[-20:]
+
+    def _run(self):
+        while True:
+            self.wake.wait()
+            time.sleep(TABLE_WRITE_COALESCE_SECONDS)  # submits do mesmo clique entram no mesmo commit
+            self.wake.clear()
+            while True:
+                with self.lock:
+                    tables = sorted(self.queued)
+                if not tables:
+                    break
+                self._commit(tables)
+
+
+@st.cache_resource
+def _table_writer() -> _TableWriter:
+    return _TableWriter()
+
+
+def _show_write_notices():
+    """Avisos de rollback da gravação otimista que esta sessão ainda não viu."""
+    seen = st.session_state.get("seen_notice", 0)
+    notices = [(n, msg) for n, msg in list(_table_writer().notices) if n > seen]
+    for _, msg in notices:
+        st.error(msg)
+    if notices:
+        st.session_state.seen_notice = notices[-1][0]
+
+
+def _show_migration_notice():
+    """Log em formato antigo (migração pendente) ou a migração automática deste processo."""
+    status = _migration_state()["status"]
+    if status == "pendente":
+        st.info(
+            f"O log no GitHub tem arquivos no formato antigo (ou o Treino_log.csv legado). "
+            f"Para migrar para o schema v{LOG_SCHEMA_VERSION}, rode `python app.py migrate-log` "
+            "ou ative `auto_migrate_log = true` em [github] nos secrets."
+        )
+    elif status == "migrando":
+        st.info(f"Migrando o log para o schema v{LOG_SCHEMA_VERSION} em segundo plano…")
+    elif status and st.session_state.get("seen_migration") != status:
+        # toast: uma vez por sessão, e não some se a página fizer rerun logo em seguida
+        st.session_state.seen_migration = status
+        st.toast(f"Migração do log: {status.split(': ', 1)[1]}", icon="✅" if status.startswith("ok") else "⚠️")
+
+
+VERSION_WATCH_SECONDS = 3
+
+
+@st.fragment(run_every=VERSION_WATCH_SECONDS)
+def _version_watcher():
+    """
+    Compara (em memória) as versões que a tela usou com as efetivas (mesma regra do
+    data_version: gravação pendente = "local:N", senão a publicada); se mudou, rerun da página.
+    """
+    seen = st.session_state.get("seen_versions", {})
+    current = _data_versions().snapshot()
+    writer = _table_writer()
+    if any((writer.local_key(t) or current.get(t, k)) != k for t, k in seen.items()):
+        st.rerun(scope="app")
 
 
 # ============================================================
 # 6) Histórico: último peso (por usuário/dia/exercicio)
 # ============================================================
-def last_weight(df_history: pd.DataFrame, user: str, day: str, exercise_name: str) -> float:
-    if df_history is None or df_history.empty:
-        return 0.0
-    df = df_history.copy()
-    df = df[df["user"].astype(str) == str(user)]
-    df = df[df["dia"].astype(str) == str(day)]
-    df = df[df["exercicio"].astype(str) == str(exercise_name)]
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=8)
+def load_last_index(version: str = "") -> dict:
+    """
+    {(user, dia, exercicio): (peso_kg, series_reps, timestamp)} do registro mais recente.
+    Montado uma vez por versão do log: preencher o peso de cada exercício vira um dict lookup.
+    """
+    df = load_history_from_github(version, ("timestamp", "user", "dia", "exercicio", "series_reps", "peso_kg"))
     if df.empty:
-        return 0.0
-    df = df.sort_values("timestamp", ascending=True)
-    val = df.iloc[-1].get("peso_kg", 0.0)
+        return {}
+    # o loader já entrega ordenado por timestamp
+    df = df.drop_duplicates(["user", "dia", "exercicio"], keep="last")
+    keys = zip(df["user"].astype(str), df["dia"].astype(str), df["exercicio"].astype(str))
+    pesos = df["peso_kg"].astype(float).round(3)
+    stamps = df["timestamp"].dt.strftime("%Y-%m-%dT%H:%M:%SZ").fillna("")
+    vals = zip(pesos, df["series_reps"].astype(str), stamps)
+    return dict(zip(keys, vals))
+
+
+# ============================================================
+# 6B) Mídia: cache local de GIFs + thumbnails redimensionados
+# ============================================================
+MEDIA_WIDTHS = (70, 180, 260)  # larguras usadas nas telas (lista, modal do dia, treino)
+MEDIA_STATIC_MAX_WIDTH = 70  # até aqui vira só o primeiro frame (lista da biblioteca)
+MEDIA_SCALE = 2  # pixels por px de tela (nítido em tela retina)
+MEDIA_CACHE_MAX_MB = 256
+MEDIA_TIMEOUT_SECONDS = 20
+MEDIA_MAX_DOWNLOAD_MB = 20  # URL digitada pelo usuário: original maior que isso é recusado
+MEDIA_RETRY_SECONDS = 600
+
+
+class _MediaCache:
+    """
+    GIFs de exercício baixados uma vez e guardados em disco (nome = sha1 da URL),
+    com thumbnails WebP por largura: estático (1º frame) nas listas, animação
+    reduzida no treino/modal. Despejo LRU pelo mtime quando passa de max_bytes.
+
+    Geração em background: enquanto o thumb não existe, a tela cai para a URL original.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.pending: set = set()
+        self.failed: dict = {}  # path -> quando falhou (não tenta de novo por MEDIA_RETRY_SECONDS)
+        self.pool = ThreadPoolExecutor(max_workers=3, thread_name_prefix="media")
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, url: str, suffix: str) -> str:
+        return os.path.join(self.root, hashlib.sha1(url.encode("utf-8")).hexdigest() + suffix)
+
+    def thumb(self, url: str, width: int, wait: bool = False) -> str:
+        """Caminho do thumbnail (WebP) ou "" se ainda não está pronto (wait=False)."""
+        path = self._path(url, f"_{width}.webp")
+        if os.path.exists(path):
+            try:
+                os.utime(path)  # marca uso recente (LRU)
+            except OSError:
+                pass
+            return path
+        if wait:
+            return path if self._build(url, width, path) else ""
+        with self.lock:
+            if path in self.pending or time.time() - self.failed.get(path, 0) < MEDIA_RETRY_SECONDS:
+                return ""
+            self.pending.add(path)
+        self.pool.submit(self._build, url, width, path)
+        return ""
+
+    def _original(self, url: str) -> str:
+        path = self._path(url, ".src")
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+        limit = MEDIA_MAX_DOWNLOAD_MB * 1024 * 1024
+        with _http().get(url, timeout=MEDIA_TIMEOUT_SECONDS, stream=True) as r:
+            r.raise_for_status()
+            if int(r.headers.get("Content-Length") or 0) > limit:
+                raise ValueError(f"mídia maior que {MEDIA_MAX_DOWNLOAD_MB} MB: {url}")
+            fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".part")
+            try:
+                size = 0
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in r.iter_content(64 * 1024):
+                        size += len(chunk)
+                        if size > limit:  # sem Content-Length (ou mentindo): corta no meio
+                            raise ValueError(f"mídia maior que {MEDIA_MAX_DOWNLOAD_MB} MB: {url}")
+                        f.write(chunk)
+                os.replace(tmp, path)
+            except BaseException:
+                _remove_quietly(tmp)
+                raise
+        return path
+
+    def _build(self, url: str, width: int, path: str) -> bool:
+        try:
+            with Image.open(self._original(url)) as im:
+                px = width * MEDIA_SCALE
+                animated = getattr(im, "is_animated", False) and width > MEDIA_STATIC_MAX_WIDTH
+                frames, durations = [], []
+                for frame in ImageSequence.Iterator(im):
+                    f = frame.convert("RGBA")
+                    f.thumbnail((px, px * 4))
+                    frames.append(f)
+                    durations.append(frame.info.get("duration", im.info.get("duration", 100)))
+                    if not animated:
+                        break
+            fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".part")
+            os.close(fd)
+            try:
+                frames[0].save(
+                    tmp, "WEBP", quality=75, method=4,
+                    save_all=len(frames) > 1, append_images=frames[1:], duration=durations, loop=0,
+                )
+                os.replace(tmp, path)
+            except BaseException:
+                _remove_quietly(tmp)
+                raise
+            self._evict()
+            return True
+        except Exception:
+            with self.lock:
+                self.failed[path] = time.time()
+            return False
+        finally:
+            with self.lock:
+                self.pending.discard(path)
+
+    def _evict(self):
+        """
+        LRU por mtime. Fica de fora o que está em uso: .part (download/encode em
+        andamento) e o original de URL com thumbnail sendo gerado.
+        """
+        with self.lock:
+            busy = {os.path.basename(p).split("_", 1)[0] + ".src" for p in self.pending}
+            files = []
+            for name in os.listdir(self.root):
+                if name.endswith(".part") or name in busy:
+                    continue
+                fp = os.path.join(self.root, name)
+                try:
+                    stt = os.stat(fp)
+                except OSError:
+                    continue
+                files.append((stt.st_mtime, stt.st_size, fp))
+            total = sum(size for _, size, _ in files)
+            for _, size, fp in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(fp)
+                    total -= size
+                except OSError:
+                    pass
+
+
+def _remove_quietly(path: str):
     try:
-        return float(val)
-    except Exception:
-        return 0.0
+        os.remove(path)
+    except OSError:
+        pass
+
+
+@st.cache_resource
+def _media_cache() -> _MediaCache:
+    cfg = st.secrets.get("media", {})
+    root = str(cfg.get("cache_dir", "") or os.path.join(tempfile.gettempdir(), "gym_media"))
+    max_mb = float(cfg.get("max_mb", MEDIA_CACHE_MAX_MB) or MEDIA_CACHE_MAX_MB)
+    return _MediaCache(root, int(max_mb * 1024 * 1024))
+
+
+def media_image(url: str, width: int, wait: bool = False) -> bool:
+    """
+    st.image via cache local: usa o thumbnail do tamanho-padrão mais próximo (>= width).
+    Enquanto o thumb não está pronto mostra a URL original. False = sem URL.
+    """
+    url = (url or "").strip()
+    if not url:
+        return False
+    size = next((w for w in MEDIA_WIDTHS if w >= width), MEDIA_WIDTHS[-1])
+    path = _media_cache().thumb(url, size, wait=wait) if url.lower().startswith(("http://", "https://")) else ""
+    st.image(path or url, width=width)
+    return True
+
+
+# ============================================================
+# 6C) Progressão: séries x reps estruturado + e1RM, volume e PRs
+# ============================================================
+PROGRESS_TREND_SESSIONS = 4  # média móvel do e1RM (sessões)
+PROGRESS_COLUMNS = [
+    "user", "exercicio", "data", "dia", "peso_kg", "series_reps", "sets", "reps_total",
+    "reps_top", "e1rm", "tonelagem", "tendencia", "pr",
+]
+_SR_HEAD = re.compile(r"^\s*(\d+)\s*x\s*(.*)$")
+_SR_REPS = re.compile(r"(\d+(?:\.\d+)?)(?:-(\d+(?:\.\d+)?))?(min|sec|seg|s)?")
+
+
+def parse_series_reps(text: str) -> tuple[int, tuple[float, ...]]:
+    """
+    Texto livre de séries -> (n_series, reps por série). Exemplos:
+      "4x18, 15, 12, 12" -> (4, (18, 15, 12, 12))   "6 x 20" -> (6, (20,)*6)
+      "3x10-12" -> (3, (11, 11, 11))                 "4 x 12 + afundo bulgaro" -> (4, (12,)*4)
+      "3x40-60s" / "3xfalha" -> (3, ())              "20min" -> (0, ())
+    Séries por tempo ou "falha" não têm reps contáveis (tupla vazia).
+    """
+    m = _SR_HEAD.match(str(text or "").lower().strip().strip("\"'"))
+    if not m:
+        return 0, ()
+    sets = int(m.group(1))
+    reps = []
+    rest = re.sub(r"\s*-\s*", "-", m.group(2))
+    for part in re.split(r"[,;\s]+", rest.strip()):
+        r = _SR_REPS.fullmatch(part)
+        if not r or r.group(3):  # texto (ex.: "afundo") ou tempo (40s, 12min): acabou a lista
+            break
+        lo = float(r.group(1))
+        hi = float(r.group(2)) if r.group(2) else lo
+        reps.append((lo + hi) / 2)
+    if not reps or sets <= 0:
+        return max(sets, 0), ()
+    if len(reps) == 1:
+        reps = reps * sets
+    # lista menor que o nº de séries: repete a última; maior: corta
+    reps = (reps + [reps[-1]] * sets)[:sets]
+    return sets, tuple(reps)
+
+
+def _series_reps_table(values: pd.Series) -> pd.DataFrame:
+    """sets/reps_total/reps_top por linha; o parser roda uma vez por texto distinto."""
+    uniq = pd.Index(values.astype(str).unique())
+    parsed = [parse_series_reps(v) for v in uniq]
+    ref = pd.DataFrame(
+        {
+            "sets": [p[0] for p in parsed],
+            "reps_total": [sum(p[1]) if p[1] else float("nan") for p in parsed],
+            "reps_top": [max(p[1]) if p[1] else float("nan") for p in parsed],
+        },
+        index=uniq,
+    )
+    return ref.reindex(values.astype(str).to_numpy()).set_axis(values.index)
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=4)
+def load_progress(version: str = "") -> pd.DataFrame:
+    """
+    Sessões do log inteiro, uma vez por versão do log: uma linha por (user, exercicio, data)
+    — último registro do dia com peso — com e1RM (Epley), tonelagem, tendência (média
+    móvel) e flag de PR. Totais por semana/mês vêm de load_rollups.
+    """
+    return _progress_tables(
+        load_history_from_github(version, ("timestamp", "user", "dia", "exercicio", "series_reps", "peso_kg"))
+    )
+
+
+def _progress_tables(df: pd.DataFrame) -> pd.DataFrame:
+    df = df[(df["peso_kg"] > 0) & df["exercicio"].astype(str).ne("") & df["timestamp"].notna()]
+    if df.empty:
+        return pd.DataFrame(columns=PROGRESS_COLUMNS)
+
+    df = df.assign(data=df["timestamp"].dt.tz_localize(None).dt.normalize())
+    # autosave grava várias linhas por treino: vale o último registro do dia (o log já vem ordenado)
+    df = df.drop_duplicates(["user", "exercicio", "data"], keep="last").reset_index(drop=True)
+    df = df.join(_series_reps_table(df["series_reps"]))
+
+    peso = df["peso_kg"].astype("float64")
+    reps_top = df["reps_top"]
+    # Epley; 1 rep = o próprio peso; sem reps contáveis (tempo/falha) = sem e1RM
+    df["e1rm"] = (peso * (1 + reps_top / 30)).where(reps_top > 1, peso.where(reps_top == 1)).round(1)
+    df["tonelagem"] = (peso * df["reps_total"]).fillna(0.0).round(1)
+
+    g = df.groupby(["user", "exercicio"], observed=True, sort=False)["e1rm"]
+    keys = [df["user"], df["exercicio"]]
+    # cummax deixa NaN nas sessões sem e1RM: o melhor até ali segue valendo (ffill) antes do shift
+    best = g.cummax().groupby(keys, observed=True).ffill()
+    prev_best = best.groupby(keys, observed=True).shift()
+    df["pr"] = df["e1rm"] > prev_best  # 1º registro de cada exercício não conta como PR
+    df["tendencia"] = (
+        g.rolling(PROGRESS_TREND_SESSIONS, min_periods=1).mean().reset_index(level=[0, 1], drop=True).round(1)
+    )
+
+    return df[PROGRESS_COLUMNS]
 
 
 # ============================================================
 # 7) TELAS
 # ============================================================
 def screen_login():
+    # os dados não dependem do usuário: já começa a baixar enquanto ele escolhe
+    _prefetch_in_background()
+
     st.title("Planner de Treinos")
     st.caption("Escolha o usuário (sem senha).")
 
@@ -486,6 +2890,8 @@ def screen_menu():
     if not user:
         goto("login")
 
+    _prefetch_in_background()
+
     st.title(f"Olá, {user} 👋")
     st.caption("O que você quer fazer agora?")
 
@@ -510,29 +2916,38 @@ def screen_menu():
         st.session_state.user = None
         goto("login")
 
+    metrics = _gh_metrics().table()
+    if not metrics.empty:
+        with st.expander("🛠️ Diagnóstico: API do GitHub (este processo)"):
+            st.dataframe(metrics, use_container_width=True, hide_index=True)
+
 
 def screen_treino():
     user = st.session_state.user
     if not user:
         goto("login")
 
-    # ✅ REFRESH: usa versões atuais
-    df_history = load_history_from_github(st.session_state.v_log)
-    df_treinos = load_treinos_from_github(st.session_state.v_treinos)
-    df_ex = load_exercicios_from_github(st.session_state.v_exercicios)
+    # os três arquivos em paralelo; os loads abaixo viram cache hits
+    _prefetch_on_change()
 
-    df_treinos = _ensure_days_for_user(df_treinos, user)
+    # ✅ REFRESH: usa versões atuais
+    last_idx = load_last_index(data_version("log", subscribe=False))  # o próprio autolog muda o log
+    v_treinos = data_version("treinos")
 
     # se teve que criar dias faltando, salva uma vez
-    dfu_days = set(df_treinos[df_treinos["user"].astype(str) == str(user)]["dia"].astype(str).unique().tolist())
-    if dfu_days != set(EDIT_DAYS):
-        save_treinos_to_github(df_treinos)
+    missing = load_treinos_index(v_treinos).missing_days(user)
+    if missing:
+        save_treinos_to_github(_ensure_days_for_user(load_treinos_from_github(v_treinos), user, missing))
         st.rerun()  # ✅ REFRESH: garante que apareça imediatamente
 
-    WORKOUTS = _workouts_from_treinos_csv(df_treinos, df_ex, user)
+    WORKOUTS = load_workouts(data_version("treinos"), data_version("exercicios"), user)
 
     st.title(f"Treino — {user}")
 
+    autolog = _autolog_queue()
+    if autolog.last_error:
+        st.warning(f"Autolog: falha ao gravar no GitHub, tentando de novo em segundo plano. ({autolog.last_error})")
+
     topL, topR = st.columns([1, 1])
     with topL:
         if st.button("⬅️ Voltar", use_container_width=True):
@@ -576,7 +2991,7 @@ def screen_treino():
             st.session_state[reps_done_key] = planned_reps
 
         if weight_key not in st.session_state:
-            st.session_state[weight_key] = last_weight(df_history, user, day, name)
+            st.session_state[weight_key] = last_idx.get((str(user), str(day), name), (0.0, "", ""))[0]
 
         if done_key not in st.session_state:
             st.session_state[done_key] = False
@@ -586,7 +3001,7 @@ def screen_treino():
             weight_val = st.session_state.get(f"{user}_{day}_{idx_local}_peso", 0.0)
             done_val = st.session_state.get(f"{user}_{day}_{idx_local}_feito", False)
 
-            _autolog_debounced(
+            _autolog_enqueue(
                 user=user,
                 day=day,
                 group=group_local,
@@ -594,6 +3009,7 @@ def screen_treino():
                 reps_done=str(reps_done_val or "").strip(),
                 weight=float(weight_val or 0.0),
                 done=bool(done_val),
+                reps_planned=planned_local,
             )
 
         st.markdown(f"### {name}")
@@ -603,7 +3019,7 @@ def screen_treino():
         cols = st.columns([2, 1])
         with cols[0]:
             if gif_url:
-                st.image(gif_url, width=260)
+                media_image(gif_url, 260)
             else:
                 st.info("Sem GIF disponível (cadastre no Gerenciar exercícios).")
 
@@ -632,9 +3048,9 @@ def screen_treino():
     c1, c2 = st.columns(2)
     with c1:
         if st.button("📄 Ver histórico (últimas 50)", use_container_width=True):
-            dfh = load_history_from_github(st.session_state.v_log)  # ✅ REFRESH
-            dfh = dfh[dfh["user"].astype(str) == str(user)]
-            dfh = dfh.sort_values("timestamp", ascending=False).head(50)
+            dfh = load_history_from_github(data_version("log"))  # ✅ REFRESH
+            dfh = dfh[dfh["user"] == str(user)]
+            dfh = dfh.tail(50).iloc[::-1]  # já vem ordenado por timestamp
             st.dataframe(dfh, use_container_width=True, height=280)
     with c2:
         if st.button("🧹 Limpar (só tela)", use_container_width=True):
@@ -654,15 +3070,28 @@ def screen_historico():
     if st.button("⬅️ Voltar", use_container_width=True):
         goto("menu")
 
-    dfh = load_history_from_github(st.session_state.v_log)  # ✅ REFRESH
-    dfh = dfh[dfh["user"].astype(str) == str(user)].copy()
+    v_log = data_version("log")  # ✅ REFRESH
+    ru = load_rollups(v_log)
+    ru = ru[ru["user"] == str(user)]
 
-    if dfh.empty:
+    if ru.empty:
         st.info("Ainda não há registros para este usuário.")
         return
 
-    dfh = dfh.sort_values("timestamp", ascending=False)
-    st.dataframe(dfh, use_container_width=True, height=520)
+    periodo = st.radio("Resumo por", ["Semana", "Mês"], horizontal=True)
+    view = ru[ru["periodo"] == ("semana" if periodo == "Semana" else "mes")]
+    st.dataframe(
+        view[["inicio", "exercicio", "dia", "peso_max", "volume", "sessoes", "taxa_feito"]].head(300),
+        use_container_width=True, height=420, hide_index=True,
+        column_config={"inicio": st.column_config.DateColumn(periodo, format="DD/MM/YYYY")},
+    )
+
+    # o log bruto só é lido se pedir
+    if st.toggle("Mostrar registros completos"):
+        dfh = load_history_from_github(v_log)
+        dfh = dfh[dfh["user"] == str(user)]
+        dfh = dfh.iloc[::-1]  # mais recentes primeiro (o loader entrega em ordem crescente)
+        st.dataframe(dfh, use_container_width=True, height=520)
 
 
 def screen_graficos():
@@ -674,27 +3103,63 @@ def screen_graficos():
     if st.button("⬅️ Voltar", use_container_width=True):
         goto("menu")
 
-    dfh = load_history_from_github(st.session_state.v_log)  # ✅ REFRESH
-    dfh = dfh[dfh["user"].astype(str) == str(user)].copy()
-    if dfh.empty:
+    v_log = data_version("log")  # ✅ REFRESH
+    semanas = load_rollups(v_log)
+    semanas = semanas[(semanas["user"] == str(user)) & (semanas["periodo"] == "semana")]
+    if semanas.empty:
         st.info("Sem dados ainda. Mexa nos pesos/feito e ele vai salvando automaticamente.")
         return
 
-    day_opts = ["(todos)"] + sorted(dfh["dia"].dropna().unique().tolist())
+    sessoes = load_progress(v_log)
+    sessoes = sessoes[sessoes["user"] == str(user)]
+
+    day_opts = ["(todos)"] + sorted(semanas["dia"].unique().tolist())
     dia_sel = st.selectbox("Filtrar por dia", options=day_opts)
     if dia_sel != "(todos)":
-        dfh = dfh[dfh["dia"] == dia_sel]
+        sessoes = sessoes[sessoes["dia"] == dia_sel]
+        semanas = semanas[semanas["dia"] == dia_sel]
 
-    ex_opts = ["(todos)"] + sorted(dfh["exercicio"].dropna().unique().tolist())
+    ex_opts = ["(todos)"] + sorted(semanas["exercicio"].unique().tolist())
     ex_sel = st.selectbox("Filtrar por exercício", options=ex_opts)
     if ex_sel != "(todos)":
-        dfh = dfh[dfh["exercicio"] == ex_sel]
+        sessoes = sessoes[sessoes["exercicio"] == ex_sel]
+        semanas = semanas[semanas["exercicio"] == ex_sel]
 
-    dfh["peso_kg"] = pd.to_numeric(dfh["peso_kg"], errors="coerce").fillna(0.0)
-    dfh = dfh.sort_values("timestamp", ascending=True)
+    if sessoes.empty:
+        st.info("Sem registros com peso para esse filtro.")
+    else:
+        e1rm = sessoes["e1rm"].dropna()
+        m1, m2, m3 = st.columns(3)
+        with m1:
+            st.metric("Melhor e1RM (kg)", f"{e1rm.max():.1f}" if not e1rm.empty else "—")
+        with m2:
+            st.metric("Tonelagem total (kg)", f"{semanas['volume'].sum():,.0f}".replace(",", "."))
+        with m3:
+            st.metric("PRs", int(sessoes["pr"].sum()))
+
+        if ex_sel != "(todos)" and not e1rm.empty:
+            st.caption("e1RM estimado (Epley) e tendência")
+            st.line_chart(sessoes.set_index("data")[["e1rm", "tendencia"]], height=260)
+
+        st.caption("Tonelagem por semana (peso × reps)")
+        st.bar_chart(semanas.groupby("inicio")["volume"].sum(), height=220)
+
+        prs = sessoes[sessoes["pr"]]
+        if not prs.empty:
+            st.caption("Últimos PRs")
+            st.dataframe(
+                prs.iloc[::-1].head(20)[["data", "exercicio", "peso_kg", "series_reps", "e1rm"]],
+                use_container_width=True, hide_index=True,
+            )
 
-    st.caption("Tabela filtrada (se quiser, eu coloco gráficos de linha/volume/PR).")
-    st.dataframe(dfh.tail(300), use_container_width=True, height=520)
+    if st.toggle("Mostrar registros (tabela)"):
+        dfh = load_history_from_github(v_log)
+        dfh = dfh[dfh["user"] == str(user)]
+        if dia_sel != "(todos)":
+            dfh = dfh[dfh["dia"] == dia_sel]
+        if ex_sel != "(todos)":
+            dfh = dfh[dfh["exercicio"] == ex_sel]
+        st.dataframe(dfh.tail(300), use_container_width=True, height=520)
 
 
 # ============================================================
@@ -718,16 +3183,17 @@ def screen_editar_treino():
     st.markdown("---")
 
     # ✅ REFRESH: usa versões atuais
-    df_all = load_treinos_from_github(st.session_state.v_treinos)
-    df_all = _ensure_days_for_user(df_all, user)
+    v_treinos = data_version("treinos")
+    df_all = load_treinos_from_github(v_treinos)
+    treinos_idx = load_treinos_index(v_treinos)
 
-    dfu_days = set(df_all[df_all["user"].astype(str) == str(user)]["dia"].astype(str).unique().tolist())
-    if dfu_days != set(EDIT_DAYS):
-        save_treinos_to_github(df_all)
+    missing = treinos_idx.missing_days(user)
+    if missing:
+        save_treinos_to_github(_ensure_days_for_user(df_all, user, missing))
         st.rerun()  # ✅ REFRESH
 
-    df_ex = load_exercicios_from_github(st.session_state.v_exercicios)
-    ex_map = _exercise_lookup(df_ex)
+    v_ex = data_version("exercicios")
+    ex_map = load_exercise_lookup(v_ex)
     ex_names = sorted([v["exercicio"] for v in ex_map.values()])
 
     st.subheader("Escolha um dia para editar")
@@ -749,11 +3215,7 @@ def screen_editar_treino():
         def day_modal():
             nonlocal df_all
 
-            dfu = df_all[df_all["user"].astype(str) == str(user)].copy()
-            dfd = dfu[dfu["dia"].astype(str) == str(day)].copy()
-            dfd["ordem"] = pd.to_numeric(dfd["ordem"], errors="coerce").fillna(9999).astype(int)
-            dfd = dfd.sort_values("ordem", ascending=True)
-
+            dfd = treinos_idx.day(user, day)  # já em ordem
             dfd_show = dfd[dfd["exercicio"].astype(str).str.strip() != ""].copy()
             st.caption("Clique em um exercício para editar. Use + para adicionar novos.")
 
@@ -770,6 +3232,7 @@ def screen_editar_treino():
                 st.info("Ainda não tem exercícios neste dia. Clique em **Adicionar exercício**.")
             else:
                 for _, r in dfd_show.iterrows():
+                    row_id = str(r["row_id"])
                     ordem = int(r.get("ordem", 9999))
                     exercicio = str(r.get("exercicio", "") or "").strip()
                     series = str(r.get("series_reps", "") or "").strip()
@@ -783,7 +3246,7 @@ def screen_editar_treino():
                     cA, cB, cC = st.columns([1, 4, 2], vertical_alignment="center")
                     with cA:
                         if gif_url:
-                            st.image(gif_url, width=70)
+                            media_image(gif_url, 70)
                         else:
                             st.caption("sem gif")
 
@@ -800,21 +3263,15 @@ def screen_editar_treino():
                             st.caption(" · ".join(meta))
 
                     with cC:
-                        if st.button("✏️ Editar", key=f"edit_{day}_{ordem}_{exercicio}", use_container_width=True):
+                        if st.button("✏️ Editar", key=f"edit_{row_id}", use_container_width=True):
                             st.session_state.edit_action = "edit"
-                            st.session_state.edit_row_id = {"day": day, "ordem": ordem, "exercicio": exercicio}
+                            st.session_state.edit_row_id = row_id
                             st.session_state.open_day_modal = False
                             st.session_state.open_ex_modal = True
                             st.rerun()
 
-                        if st.button("🗑️ Remover", key=f"del_{day}_{ordem}_{exercicio}", use_container_width=True):
-                            mask = (
-                                (df_all["user"].astype(str) == str(user)) &
-                                (df_all["dia"].astype(str) == str(day)) &
-                                (pd.to_numeric(df_all["ordem"], errors="coerce").fillna(9999).astype(int) == ordem) &
-                                (df_all["exercicio"].astype(str) == str(exercicio))
-                            )
-                            df_all = df_all[~mask].copy()
+                        if st.button("🗑️ Remover", key=f"del_{row_id}", use_container_width=True):
+                            df_all = df_all.drop(index=treinos_idx.by_id[row_id])
                             if save_treinos_to_github(df_all):
                                 st.success("Removido ✅")
                                 st.rerun()  # ✅ REFRESH imediato
@@ -835,9 +3292,9 @@ def screen_editar_treino():
         def ex_modal():
             nonlocal df_all
 
-            dfu = df_all[df_all["user"].astype(str) == str(user)].copy()
-            dfd = dfu[dfu["dia"].astype(str) == str(day)].copy()
-            dfd["ordem"] = pd.to_numeric(dfd["ordem"], errors="coerce").fillna(9999).astype(int)
+            dfd = treinos_idx.day(user, day)
+            # linha em edição (some se outra sessão a removeu: aí salvar vira adicionar)
+            label = treinos_idx.by_id.get(st.session_state.edit_row_id) if action == "edit" else None
 
             default_ordem = int(dfd["ordem"].max()) + 1 if not dfd.empty else 1
             default_ex = ""
@@ -845,24 +3302,13 @@ def screen_editar_treino():
             default_grupo_override = ""
             default_alt_group = ""
 
-            if action == "edit" and st.session_state.edit_row_id:
-                rid = st.session_state.edit_row_id
-                ordem0 = int(rid["ordem"])
-                ex0 = str(rid["exercicio"])
-                mask = (
-                    (df_all["user"].astype(str) == str(user)) &
-                    (df_all["dia"].astype(str) == str(day)) &
-                    (pd.to_numeric(df_all["ordem"], errors="coerce").fillna(9999).astype(int) == ordem0) &
-                    (df_all["exercicio"].astype(str) == ex0)
-                )
-                row = df_all[mask]
-                if not row.empty:
-                    rr = row.iloc[0]
-                    default_ordem = int(pd.to_numeric(rr.get("ordem", ordem0), errors="coerce") or ordem0)
-                    default_ex = str(rr.get("exercicio", "") or "")
-                    default_series = str(rr.get("series_reps", "") or "")
-                    default_grupo_override = str(rr.get("grupo", "") or "")
-                    default_alt_group = str(rr.get("alt_group", "") or "")
+            if label is not None:
+                rr = treinos_idx.df.loc[label]
+                default_ordem = int(rr["ordem"])
+                default_ex = str(rr.get("exercicio", "") or "")
+                default_series = str(rr.get("series_reps", "") or "")
+                default_grupo_override = str(rr.get("grupo", "") or "")
+                default_alt_group = str(rr.get("alt_group", "") or "")
 
             st.caption("Escolha um exercício cadastrado. Grupo e GIF vêm do cadastro (você pode sobrescrever o grupo se quiser).")
 
@@ -871,10 +3317,16 @@ def screen_editar_treino():
             with c1:
                 ordem = st.number_input("Ordem", min_value=1, step=1, value=int(default_ordem))
 
-                options = ["(selecionar...)"] + ex_names
+                busca = st.text_input("Buscar na biblioteca", value="", placeholder="Ex: gluteo, squat, remada…")
+                names = search_exercise_names(v_ex, busca) if _fold(busca) else ex_names
+                if default_ex and default_ex in ex_names and default_ex not in names:
+                    names = [default_ex] + names
+                options = ["(selecionar...)"] + names
                 idx = 0
-                if default_ex and default_ex in ex_names:
+                if default_ex and default_ex in names:
                     idx = options.index(default_ex)
+                elif busca and names:
+                    idx = 1  # melhor resultado já selecionado
                 selected_ex = st.selectbox("Exercício (biblioteca)", options=options, index=idx)
 
                 manual = selected_ex == "(selecionar...)"
@@ -895,7 +3347,7 @@ def screen_editar_treino():
                 alt_group = st.text_input("alt_group (opcional)", value=(default_alt_group or alt_group_padrao))
 
                 if gif_url:
-                    st.image(gif_url, width=180)
+                    media_image(gif_url, 180)
                 else:
                     st.info("Sem preview (cadastre o GIF em Gerenciar exercícios).")
 
@@ -915,24 +3367,12 @@ def screen_editar_treino():
                         st.error("Escolha ou preencha o exercício.")
                         return
 
-                    if action == "edit" and st.session_state.edit_row_id:
-                        rid = st.session_state.edit_row_id
-                        ordem0 = int(rid["ordem"])
-                        ex0 = str(rid["exercicio"])
-                        mask_old = (
-                            (df_all["user"].astype(str) == str(user)) &
-                            (df_all["dia"].astype(str) == str(day)) &
-                            (pd.to_numeric(df_all["ordem"], errors="coerce").fillna(9999).astype(int) == ordem0) &
-                            (df_all["exercicio"].astype(str) == ex0)
-                        )
-                        df_all = df_all[~mask_old].copy()
-
                     ref2 = ex_map.get(str(exercicio).strip().lower())
                     grupo_final = (grupo_override or "").strip()
                     if not grupo_final:
                         grupo_final = (ref2.get("grupo", "") if ref2 else "").strip()
 
-                    new_row = pd.DataFrame([{
+                    row = {
                         "user": user,
                         "dia": day,
                         "ordem": int(ordem),
@@ -941,9 +3381,14 @@ def screen_editar_treino():
                         "series_reps": str(series or "").strip(),
                         "gif_key": (ref2.get("gif_key", "") if ref2 else ""),
                         "alt_group": str(alt_group or "").strip(),
-                    }], columns=TREINOS_COLUMNS)
+                        "row_id": st.session_state.edit_row_id if label is not None else _new_row_id(),
+                    }
 
-                    df_all = pd.concat([df_all, new_row], ignore_index=True)
+                    if label is not None:
+                        # edição no lugar: mesma linha, mesmo row_id (df_all é a cópia desta sessão)
+                        df_all.loc[label, TREINOS_COLUMNS] = [row[c] for c in TREINOS_COLUMNS]
+                    else:
+                        df_all = pd.concat([df_all, pd.DataFrame([row], columns=TREINOS_COLUMNS)], ignore_index=True)
 
                     if save_treinos_to_github(df_all):
                         st.success("Salvo ✅")
@@ -970,32 +3415,19 @@ def screen_editar_treino():
 # ============================================================
 # Tela: Gerenciar exercícios (listar/editar/excluir)
 # ============================================================
-def screen_gerenciar_exercicios():
-    user = st.session_state.user
-    if not user:
-        goto("login")
-
-    st.title("🧩 Gerenciar exercícios")
-    top1, top2 = st.columns([1, 1])
-    with top1:
-        if st.button("⬅️ Voltar", use_container_width=True):
-            goto("menu")
-    with top2:
-        if st.button("🔁 Trocar usuário", use_container_width=True):
-            st.session_state.user = None
-            goto("login")
-
-    st.markdown("---")
-
-    # ✅ REFRESH: usa versões atuais
-    df_ex = load_exercicios_from_github(st.session_state.v_exercicios)
-    df_ex = _clean_nans(df_ex)
+@st.fragment
+def _exercise_library(v_ex: str):
+    """
+    Lista paginada do catálogo. Fragmento: digitar na busca ou trocar de página
+    só redesenha a lista (e só page_size linhas/thumbnails), não a tela inteira.
+    """
+    df_lib = load_exercise_library(v_ex)
 
     c1, c2, c3 = st.columns([2, 2, 1])
     with c1:
-        q = st.text_input("Buscar (nome do exercício)", value="", placeholder="Ex: Supino, Remada, Abdutora…")
+        q = st.text_input("Buscar (nome, grupo, alt_group)", value="", placeholder="Ex: Supino, gluteo, squat…")
     with c2:
-        grupos = sorted([g for g in df_ex["grupo"].astype(str).unique().tolist() if str(g).strip() != ""])
+        grupos = sorted([g for g in df_lib["grupo"].astype(str).unique().tolist() if str(g).strip() != ""])
         grupo_sel = st.selectbox("Filtrar por grupo", options=["(todos)"] + grupos)
     with c3:
         if st.button("➕ Novo", use_container_width=True):
@@ -1004,15 +3436,19 @@ def screen_gerenciar_exercicios():
             st.session_state.open_exercise_modal = True
             st.rerun()
 
-    df_show = df_ex.copy()
-    if q.strip():
-        df_show = df_show[df_show["exercicio"].astype(str).str.contains(q.strip(), case=False, na=False)]
-    if grupo_sel != "(todos)":
-        df_show = df_show[df_show["grupo"].astype(str) == str(grupo_sel)]
+    grupo = "" if grupo_sel == "(todos)" else str(grupo_sel)
+    page_size = st.session_state.ex_page_size
+    # filtro novo volta para a primeira página
+    if st.session_state.ex_query != (_fold(q), grupo):
+        st.session_state.ex_query = (_fold(q), grupo)
+        st.session_state.ex_page = 0
 
-    df_show = df_show.sort_values(["grupo", "exercicio"], ascending=True)
+    _, total = query_exercise_library(v_ex, q, grupo, 0, page_size)
+    pages = max((total + page_size - 1) // page_size, 1)
+    page = min(st.session_state.ex_page, pages - 1)
+    df_show, _ = query_exercise_library(v_ex, q, grupo, page, page_size)
 
-    st.caption(f"Total: {len(df_show)} exercício(s)")
+    st.caption(f"Total: {total} exercício(s)")
 
     if df_show.empty:
         st.info("Nenhum exercício encontrado.")
@@ -1025,12 +3461,10 @@ def screen_gerenciar_exercicios():
             alt_group = str(r.get("alt_group", "") or "").strip()
             obs = str(r.get("observacoes", "") or "").strip()
 
-            thumb = _thumb_from_url(gif_url)
-
             cA, cB, cC = st.columns([1, 4, 2], vertical_alignment="center")
             with cA:
-                if thumb:
-                    st.image(thumb, width=70)
+                if gif_url:
+                    media_image(gif_url, 70)
                 else:
                     st.caption("sem gif")
 
@@ -1056,6 +3490,7 @@ def screen_gerenciar_exercicios():
                     st.rerun()
 
                 if st.button("🗑️ Excluir", key=f"ex_del_{ex_name}", use_container_width=True):
+                    df_ex = _clean_nans(load_exercicios_from_github(v_ex))
                     df_new = df_ex[df_ex["exercicio"].astype(str) != ex_name].copy()
                     ok = save_exercicios_to_github(df_new)
                     if ok:
@@ -1066,6 +3501,49 @@ def screen_gerenciar_exercicios():
 
             st.divider()
 
+    # callbacks (on_click): o clique já redesenha só o fragmento, com a página nova
+    def _set_page(n: int):
+        st.session_state.ex_page = n
+
+    def _set_size():
+        st.session_state.ex_page_size = st.session_state.ex_page_size_sel
+        st.session_state.ex_page = 0
+
+    p1, p2, p3, p4 = st.columns([1, 2, 1, 2], vertical_alignment="center")
+    with p1:
+        st.button("◀", key="ex_prev", disabled=page == 0, on_click=_set_page, args=(page - 1,), use_container_width=True)
+    with p2:
+        st.caption(f"Página {page + 1} de {pages}")
+    with p3:
+        st.button("▶", key="ex_next", disabled=page >= pages - 1, on_click=_set_page, args=(page + 1,), use_container_width=True)
+    with p4:
+        st.selectbox("Por página", EX_PAGE_SIZES, index=EX_PAGE_SIZES.index(page_size), key="ex_page_size_sel", on_change=_set_size)
+
+
+def screen_gerenciar_exercicios():
+    user = st.session_state.user
+    if not user:
+        goto("login")
+
+    st.title("🧩 Gerenciar exercícios")
+    top1, top2 = st.columns([1, 1])
+    with top1:
+        if st.button("⬅️ Voltar", use_container_width=True):
+            goto("menu")
+    with top2:
+        if st.button("🔁 Trocar usuário", use_container_width=True):
+            st.session_state.user = None
+            goto("login")
+
+    st.markdown("---")
+
+    # ✅ REFRESH: usa versões atuais
+    v_ex = data_version("exercicios")
+    df_ex = load_exercicios_from_github(v_ex)
+    df_ex = _clean_nans(df_ex)
+
+    _exercise_library(v_ex)
+
     if st.session_state.open_exercise_modal:
         action = st.session_state.ex_action
         edit_name = str(st.session_state.ex_edit_name or "").strip()
@@ -1104,10 +3582,7 @@ def screen_gerenciar_exercicios():
             with c2:
                 gif_key = st.text_input("gif_key (opcional)", value=d_gif_key, placeholder="Ex: supino_inclinado_db")
                 gif_url = st.text_input("gif_url (cole a URL do GIF)", value=d_gif_url, placeholder="https://...gif")
-                thumb = _thumb_from_url(gif_url)
-                if thumb:
-                    st.image(thumb, width=200)
-                else:
+                if not media_image(gif_url, 200):
                     st.info("Sem preview (cole a URL do GIF).")
 
             st.markdown("---")
@@ -1166,6 +3641,10 @@ def screen_gerenciar_exercicios():
 # ============================================================
 def main():
     init_state()
+    # cada tela assina de novo as tabelas que ler
+    st.session_state.seen_versions = {}
+    _show_write_notices()
+    _show_migration_notice()
 
     screens = {
         "login": screen_login,
@@ -1178,7 +3657,53 @@ def main():
     }
 
     screens.get(st.session_state.screen, screen_login)()
+    _version_watcher()
+
+
+def _cli(argv: list[str]) -> int:
+    """
+    Comandos de manutenção (fora do `streamlit run`):
+      python app.py import-csv [dir]   # Data/*.csv -> storage configurado (SQLite)
+      python app.py export-csv [dir]   # storage configurado (SQLite) -> CSVs
+      python app.py compact-log        # regrava Data/log/snapshot.parquet no GitHub
+      python app.py rebuild-rollups    # recalcula os rollups semana/mês (SQLite); GitHub: apaga o rollups.parquet antigo
+      python app.py compact-sessions   # log canônico (1 linha por exercício/sessão); eventos -> arquivo
+      python app.py migrate-log        # log (e o Treino_log.csv legado) -> schema atual (ou github.auto_migrate_log)
+    """
+    cmd = argv[0] if argv else ""
+    data_dir = argv[1] if len(argv) > 1 else DATA_DIR
+    storage = _storage()
+    if cmd == "compact-log":
+        ok, err = compact_log_snapshot()
+        print("ok" if ok else err)
+        return 0 if ok else 1
+    if cmd == "migrate-log":
+        ok, msg = migrate_log_schema() if isinstance(storage, GitHubStorage) else (True, "SQLite migra ao abrir o banco")
+        print(msg)
+        return 0 if ok else 1
+    if cmd == "compact-sessions":
+        ok, msg = storage.compact_sessions()
+        print(msg)
+        return 0 if ok else 1
+    if cmd == "rebuild-rollups":
+        ok, err = storage.rebuild_rollups()
+        print("ok" if ok else err)
+        return 0 if ok else 1
+    if cmd in ("import-csv", "export-csv"):
+        if not isinstance(storage, SQLiteStorage):
+            print("Configure [storage] backend = \"sqlite\" em st.secrets para importar/exportar.")
+            return 1
+        counts = storage.import_csv(data_dir) if cmd == "import-csv" else storage.export_csv(data_dir)
+        print(json.dumps(counts, ensure_ascii=False))
+        return 0
+    print(_cli.__doc__)
+    return 1
 
 
 if __name__ == "__main__":
-    main()
+    from streamlit import runtime
+
+    if runtime.exists():
+        main()
+    else:
+        sys.exit(_cli(sys.argv[1:]))
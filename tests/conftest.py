@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from fake_github import FakeRepo, serve  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def _clear_caches():
+    app.st.cache_data.clear()
+    app.st.cache_resource.clear()
+    yield
+    app.st.cache_data.clear()
+    app.st.cache_resource.clear()
+
+
+@pytest.fixture
+def github(monkeypatch):
+    """FakeRepo servido em 127.0.0.1 e apontado por st.secrets["github"]."""
+    repo = FakeRepo()
+    server = serve(repo)
+    api_url = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setattr(app.st, "secrets", {"github": {"token": "x", "owner": "o", "repo": "r", "api_url": api_url}})
+    yield repo
+    server.shutdown()
+    server.server_close()
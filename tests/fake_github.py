@@ -0,0 +1,154 @@
+"""
+GitHub de mentira (em processo) para os testes: Contents API (GET/PUT) e o
+pedaço da Git Data API que o gh_commit_files usa (blobs, trees, commits, refs).
+Um repo o/r, branch main, arquivos em memória.
+"""
+import base64
+import hashlib
+import itertools
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeRepo:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.blobs: dict[str, bytes] = {}
+        self.trees: dict[str, dict] = {"t0": {}}
+        self.commits: dict[str, dict] = {"c0": {"tree": "t0", "parents": [], "message": ""}}
+        self.head = "c0"
+        self.calls: list[tuple[str, str]] = []
+        self.reject_patches = 0  # próximos N PATCH do ref respondem 422 (corrida com outro commit)
+
+    def files(self) -> dict[str, bytes]:
+        return {path: self.blobs[sha] for path, sha in self.trees[self.commits[self.head]["tree"]].items()}
+
+    def blob(self, content: bytes) -> str:
+        sha = hashlib.sha1(content).hexdigest()
+        self.blobs[sha] = content
+        return sha
+
+    def commit(self, changes: dict, message: str = "") -> str:
+        """Commit direto no main (outro device): {path: bytes | None}."""
+        with self.lock:
+            tree = dict(self.trees[self.commits[self.head]["tree"]])
+            for path, content in changes.items():
+                if content is None:
+                    tree.pop(path, None)
+                else:
+                    tree[path] = self.blob(content)
+            return self._new_commit(tree, [self.head], message, move_head=True)
+
+    def _new_commit(self, tree: dict, parents: list, message: str, move_head: bool) -> str:
+        tree_sha = f"t{next(self.ids)}"
+        self.trees[tree_sha] = tree
+        sha = f"c{next(self.ids)}"
+        self.commits[sha] = {"tree": tree_sha, "parents": parents, "message": message}
+        if move_head:
+            self.head = sha
+        return sha
+
+
+class _Handler(BaseHTTPRequestHandler):
+    repo: FakeRepo
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code: int, obj=None, headers: dict | None = None):
+        body = json.dumps(obj if obj is not None else {}).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> dict:
+        n = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(n) or b"{}")
+
+    def _route(self) -> str:
+        self.repo.calls.append((self.command, self.path.split("?")[0]))
+        return self.path.split("?")[0].split("/repos/o/r", 1)[-1]
+
+    def do_GET(self):
+        p = self._route()
+        repo = self.repo
+        with repo.lock:
+            if p.startswith("/git/ref/heads/"):
+                return self._send(200, {"object": {"sha": repo.head}})
+            if p.startswith("/git/commits/"):
+                c = repo.commits.get(p.rsplit("/", 1)[1])
+                return self._send(200, {"tree": {"sha": c["tree"]}}) if c else self._send(404)
+            if p.startswith("/contents/"):
+                sha = repo.trees[repo.commits[repo.head]["tree"]].get(p[len("/contents/"):])
+                if sha is None:
+                    return self._send(404)
+                if self.headers.get("If-None-Match") == f'"{sha}"':
+                    self.send_response(304)
+                    self.end_headers()
+                    return None
+                content = base64.b64encode(repo.blobs[sha]).decode()
+                return self._send(200, {"sha": sha, "content": content, "encoding": "base64"}, {"ETag": f'"{sha}"'})
+        return self._send(404)
+
+    def do_POST(self):
+        p = self._route()
+        body = self._body()
+        repo = self.repo
+        with repo.lock:
+            if p == "/git/blobs":
+                return self._send(201, {"sha": repo.blob(base64.b64decode(body["content"]))})
+            if p == "/git/trees":
+                tree = dict(repo.trees[body["base_tree"]])
+                for item in body["tree"]:
+                    if item["sha"] is None:
+                        tree.pop(item["path"], None)
+                    else:
+                        tree[item["path"]] = item["sha"]
+                sha = f"t{next(repo.ids)}"
+                repo.trees[sha] = tree
+                return self._send(201, {"sha": sha})
+            if p == "/git/commits":
+                sha = f"c{next(repo.ids)}"
+                repo.commits[sha] = {"tree": body["tree"], "parents": body["parents"], "message": body["message"]}
+                return self._send(201, {"sha": sha})
+        return self._send(404)
+
+    def do_PATCH(self):
+        self._route()
+        body = self._body()
+        repo = self.repo
+        with repo.lock:
+            if repo.reject_patches:
+                repo.reject_patches -= 1
+                return self._send(422, {"message": "Update is not a fast forward"})
+            if repo.commits[body["sha"]]["parents"] != [repo.head]:
+                return self._send(422, {"message": "Update is not a fast forward"})
+            repo.head = body["sha"]
+        return self._send(200, {"object": {"sha": body["sha"]}})
+
+    def do_PUT(self):
+        p = self._route()
+        body = self._body()
+        repo = self.repo
+        path = p[len("/contents/"):]
+        with repo.lock:
+            current = repo.trees[repo.commits[repo.head]["tree"]].get(path)
+            if current is not None and body.get("sha") != current:
+                return self._send(409, {"message": f"{path} does not match {body.get('sha')}"})
+            tree = dict(repo.trees[repo.commits[repo.head]["tree"]])
+            tree[path] = repo.blob(base64.b64decode(body["content"]))
+            repo._new_commit(tree, [repo.head], body["message"], move_head=True)
+            return self._send(201, {"content": {"sha": tree[path]}})
+
+
+def serve(repo: FakeRepo) -> ThreadingHTTPServer:
+    handler = type("Handler", (_Handler,), {"repo": repo})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    return server
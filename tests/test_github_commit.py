@@ -0,0 +1,87 @@
+import app
+
+
+def _posts(repo, route):
+    return [p for m, p in repo.calls if m == "POST" and p.endswith(route)]
+
+
+def test_commit_files_writes_all_files_in_one_commit(github):
+    github.commit({"Data/a.csv": b"a\n"})
+    head = github.head
+
+    ok, err = app.gh_commit_files({"Data/a.csv": "a\n1\n", "Data/b.csv": "b\n2\n", "Data/x.bin": b"\x00\x01"}, "set")
+
+    assert (ok, err) == (True, "")
+    assert github.files() == {"Data/a.csv": b"a\n1\n", "Data/b.csv": b"b\n2\n", "Data/x.bin": b"\x00\x01"}
+    assert github.commits[github.head]["parents"] == [head]
+    assert github.commits[github.head]["message"] == "set"
+    assert len(_posts(github, "/git/commits")) == 1
+    # o sha gravado vira o conhecido: o próximo PUT não precisa de GET antes
+    assert app._sha_cache()["Data/b.csv"] == github.trees[github.commits[github.head]["tree"]]["Data/b.csv"]
+
+
+def test_commit_files_single_file_uses_contents_put(github):
+    ok, _ = app.gh_commit_files({"Data/a.csv": "a\n"}, "one")
+
+    assert ok
+    assert github.files() == {"Data/a.csv": b"a\n"}
+    assert [m for m, _ in github.calls if m != "GET"] == ["PUT"]
+
+
+def test_commit_files_none_deletes(github):
+    github.commit({"Data/old.csv": b"old\n", "Data/keep.csv": b"keep\n"})
+    app._gh_file_meta("Data/old.csv")
+
+    ok, _ = app.gh_commit_files({"Data/old.csv": None}, "rm")
+
+    assert ok
+    assert github.files() == {"Data/keep.csv": b"keep\n"}
+    assert "Data/old.csv" not in app._sha_cache()
+    assert not _posts(github, "/git/blobs")
+
+
+def test_commit_files_retries_once_on_422(github):
+    github.commit({"Data/a.csv": b"a\n"})
+    github.reject_patches = 1
+
+    ok, err = app.gh_commit_files({"Data/a.csv": "a\n1\n", "Data/b.csv": "b\n"}, "retry")
+
+    assert (ok, err) == (True, "")
+    assert github.files() == {"Data/a.csv": b"a\n1\n", "Data/b.csv": b"b\n"}
+    assert len([m for m, _ in github.calls if m == "PATCH"]) == 2
+    # blobs sobem uma vez; tree e commit são refeitos sobre o head novo
+    assert len(_posts(github, "/git/blobs")) == 2
+    assert len(_posts(github, "/git/commits")) == 2
+
+
+def test_commit_files_gives_up_after_second_422(github):
+    github.reject_patches = 2
+
+    ok, err = app.gh_commit_files({"Data/a.csv": "a\n", "Data/b.csv": "b\n"}, "retry")
+
+    assert not ok
+    assert err.startswith("Erro GitHub: 422")
+    assert github.files() == {}
+
+
+def test_commit_files_stale_base_is_a_conflict(github):
+    github.commit({"Data/a.csv": b"a\n", "Data/b.csv": b"b\n"})
+    base = app._gh_file_meta("Data/a.csv")["sha"]
+    github.commit({"Data/a.csv": b"a\nother device\n"})  # outro device salvou depois da leitura
+
+    ok, err = app.gh_commit_files({"Data/a.csv": "a\nmine\n", "Data/b.csv": "b\nmine\n"}, "stale", base_shas={"Data/a.csv": base})
+
+    assert not ok
+    assert app._is_conflict(err)
+    assert github.files() == {"Data/a.csv": b"a\nother device\n", "Data/b.csv": b"b\n"}
+    assert not [m for m, _ in github.calls if m == "PATCH"]
+
+
+def test_commit_files_current_base_commits(github):
+    github.commit({"Data/a.csv": b"a\n"})
+    base = app._gh_file_meta("Data/a.csv")["sha"]
+
+    ok, _ = app.gh_commit_files({"Data/a.csv": "a\nmine\n", "Data/b.csv": "b\n"}, "ok", base_shas={"Data/a.csv": base})
+
+    assert ok
+    assert github.files()["Data/a.csv"] == b"a\nmine\n"
@@ -0,0 +1,36 @@
+import time
+
+import app
+
+LEGACY = "timestamp,user,dia,grupo,exercicio,series_reps,peso_kg,feito\n2025-01-06T10:00:00Z,Ana,Segunda,Peito,Supino,4x8,30,1\n"
+
+
+def _wait_migration():
+    state = app._migration_state()
+    for _ in range(100):
+        if state["status"] != "migrando":
+            return state["status"]
+        time.sleep(0.05)
+    return state["status"]
+
+
+def test_load_does_not_migrate_by_default(github):
+    github.commit({app.GITHUB_LOG_LEGACY_PATH: LEGACY.encode()})
+
+    app._load_log_github()
+
+    assert app._migration_state()["status"] == "pendente"
+    assert not [m for m, _ in github.calls if m != "GET"]
+    assert app.GITHUB_LOG_LEGACY_PATH in github.files()
+
+
+def test_load_migrates_when_enabled(github):
+    app.st.secrets["github"]["auto_migrate_log"] = True
+    github.commit({app.GITHUB_LOG_LEGACY_PATH: LEGACY.encode()})
+
+    app._load_log_github()
+
+    assert _wait_migration().startswith("ok")
+    files = github.files()
+    assert app.GITHUB_LOG_LEGACY_PATH not in files
+    assert files[app._log_segment_path("2025-01-06T10:00:00Z")].startswith(",".join(app.LOG_COLUMNS).encode())
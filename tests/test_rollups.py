@@ -0,0 +1,65 @@
+import pandas as pd
+
+import app
+
+
+def _log(*rows):
+    """rows: (timestamp, exercicio, peso_kg, feito)."""
+    return pd.DataFrame(
+        [
+            {"timestamp": ts, "user": "Ana", "dia": "Segunda", "grupo": "Peito", "exercicio": ex,
+             "series_reps": "4x8", "series_reps_planejado": "4x8", "peso_kg": peso, "feito": feito}
+            for ts, ex, peso, feito in rows
+        ],
+        columns=app.LOG_COLUMNS,
+    )
+
+
+def _sorted(df):
+    return df.sort_values(app.ROLLUP_KEYS).reset_index(drop=True)
+
+
+RECENT = _log(
+    ("2026-03-10T10:00:00Z", "Supino", 40.0, 1),
+    ("2026-03-12T10:00:00Z", "Supino", 42.5, 1),
+    ("2026-03-12T10:05:00Z", "Remada", 30.0, 0),
+)
+# legado migrado / journal reprocessado: mais antigo que o que já foi contado
+OLDER = _log(
+    ("2026-02-27T10:00:00Z", "Supino", 37.5, 1),
+    ("2026-03-09T10:00:00Z", "Supino", 45.0, 1),
+    ("2026-03-11T10:00:00Z", "Remada", 32.5, 1),
+)
+
+
+def test_update_rollups_in_order_matches_full():
+    later = _log(("2026-03-12T18:00:00Z", "Supino", 47.5, 0), ("2026-03-20T10:00:00Z", "Supino", 50.0, 1))
+    full = pd.concat([RECENT, later], ignore_index=True)
+    got = app._update_rollups(app._rollup_rows(RECENT), later, lambda since: full)
+    pd.testing.assert_frame_equal(_sorted(got), _sorted(app._rollup_rows(full)))
+
+
+def test_update_rollups_older_batch_matches_full():
+    full = pd.concat([RECENT, OLDER], ignore_index=True)
+    seen = []
+
+    def log_since(since):
+        seen.append(since)
+        return full[pd.to_datetime(full["timestamp"], utc=True) >= pd.Timestamp(since, tz="UTC")]
+
+    got = app._update_rollups(app._rollup_rows(RECENT), OLDER, log_since)
+    assert seen == ["2026-02-01"]
+    pd.testing.assert_frame_equal(_sorted(got), _sorted(app._rollup_rows(full)))
+
+
+def test_sqlite_older_append_matches_rebuild(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "DATA_DIR", str(tmp_path / "Data"))
+    storage = app.SQLiteStorage(str(tmp_path / "t.sqlite3"))
+    assert storage.append_log(RECENT) == (True, "")
+    assert storage.append_log(OLDER) == (True, "")
+    incremental = _sorted(storage.load_rollups())
+
+    assert storage.rebuild_rollups() == (True, "")
+    rebuilt = _sorted(storage.load_rollups())
+    pd.testing.assert_frame_equal(incremental, rebuilt)
+    assert rebuilt.loc[rebuilt["periodo"].eq("semana") & rebuilt["exercicio"].eq("Supino"), "sessoes"].tolist() == [1, 3]
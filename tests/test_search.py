@@ -0,0 +1,59 @@
+import itertools
+import time
+
+import pandas as pd
+import pytest
+
+import app
+
+MOVES = ["Supino", "Agachamento", "Remada", "Puxada", "Rosca", "Tríceps", "Elevação", "Leg Press", "Abdutora", "Glúteo"]
+MODS = ["Reto", "Inclinado", "Livre", "Máquina", "Halter", "Barra", "Cabo", "Unilateral", "Sentado", "Martelo"]
+ENG = ["Bench Press", "Barbell Squat", "Row", "Pulldown", "Curl", "Extension", "Raise", "Fly", "Deadlift", "Calf Raise"]
+GRUPOS = ["Peito", "Costas", "Pernas", "Ombros", "Bíceps", "Tríceps", "Abdômen", "Glúteos"]
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    """10k exercícios no formato do exercicios.csv."""
+    combos = itertools.islice(itertools.cycle(itertools.product(MOVES, MODS, ENG)), 10_000)
+    rows = [
+        {"grupo": GRUPOS[i % len(GRUPOS)], "exercicio": f"{m} {mod} ({e}) {i}", "alt_group": m.lower(), "gif_key": f"gif_{i}"}
+        for i, (m, mod, e) in enumerate(combos)
+    ]
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture(scope="module")
+def index(catalog):
+    return app._SearchIndex(catalog)
+
+
+def test_search_folds_accents_and_ranks_exact_first(index, catalog):
+    hits = catalog.iloc[index.search("gluteo")]
+    assert not hits.empty
+    assert (hits["exercicio"].str.startswith("Glúteo") | hits["grupo"].eq("Glúteos")).all()
+    assert index.search("Glúteo") == index.search("gluteo")
+    # exercicio (peso 3) antes de quem só casa pelo grupo "Glúteos" (peso 1, prefixo)
+    first_by_group = (~hits["exercicio"].str.startswith("Glúteo")).to_numpy().argmax()
+    assert hits["exercicio"].iloc[:first_by_group].str.startswith("Glúteo").all()
+    assert not hits["exercicio"].iloc[first_by_group:].str.startswith("Glúteo").any()
+
+
+def test_search_mixed_names_and_typos(index, catalog):
+    top = catalog["exercicio"].iloc[index.search("agachamento barbell squat", limit=5)]
+    assert top.str.startswith("Agachamento").all() and top.str.contains("Barbell Squat").all()
+    assert index.search("agachamnto livre", limit=1) == index.search("agachamento livre", limit=1)
+    assert index.search("xyz") == []
+
+
+@pytest.mark.parametrize("query", ["supino", "gluteo", "agachamento livre", "barbell squat", "s"])
+def test_search_is_sub_millisecond_at_10k(index, query):
+    index.search(query)
+    best = min(_timed(index, query) for _ in range(20))
+    assert best < 1.0, f"{query!r}: {best:.2f} ms"
+
+
+def _timed(index, query) -> float:
+    t0 = time.perf_counter()
+    index.search(query)
+    return (time.perf_counter() - t0) * 1000.0